@@ -0,0 +1,140 @@
+"""
+Redis layout of live candles, one key family per timeframe:
+candles{YYYYMMDD}:{symbol}          3 second candles (the original family, read by dynamic candles / LiveQuote)
+candles_{label}{YYYYMMDD}:{symbol}  other timeframes, e.g. candles_1m20251007:NFO:NIFTY25O0725000CE
+Members are json candles scored by candle start (epoch seconds).
+With CANDLE_STORE=packed (or both) the same candles are kept as fixed width binary records instead (or as well),
+see packed_key.
+"""
+import datetime
+import numpy as np
+import pandas as pd
+
+BASE_TIMEFRAME = 3
+
+
+def timeframe_label(timeframe: int):
+    if timeframe % 3600 == 0:
+        return f"{timeframe // 3600}h"
+    if timeframe % 60 == 0:
+        return f"{timeframe // 60}m"
+    return f"{timeframe}s"
+
+
+def key_prefix(date, timeframe=BASE_TIMEFRAME):
+    """date: datetime.date / datetime or epoch seconds of any candle in the day"""
+    if isinstance(date, (int, float)):
+        date = datetime.datetime.fromtimestamp(date)
+    family = "candles" if timeframe == BASE_TIMEFRAME else f"candles_{timeframe_label(timeframe)}"
+    return f"{family}{date:%Y%m%d}:"
+
+
+def candle_key(date, symbol: str, timeframe=BASE_TIMEFRAME):
+    return f"{key_prefix(date, timeframe)}{symbol}"
+
+
+# packed layout: p{candle key}, e.g. pcandles20251007:NFO:NIFTY25O0725000CE, fixed width records appended as the
+# candles are uploaded (one APPEND each), so a key only ever holds the candles written to it: an illiquid strike that
+# first trades at 15:00 costs one record, not a zero filled string from the session start. Records are in start
+# time order except for amended candles, which are appended again; readers keep the last record per start time.
+CANDLE_RECORD = np.dtype([("t", "<u4"), ("open", "<f4"), ("high", "<f4"), ("low", "<f4"), ("close", "<f4"),
+                          ("volume", "<u8"), ("oi", "<u8")])  # 36 bytes, prices rounded to 2 decimals on read
+
+
+def packed_key(date, symbol: str, timeframe=BASE_TIMEFRAME):
+    return f"p{candle_key(date, symbol, timeframe)}"
+
+
+def pack_candle(candle_time: int, candle: dict):
+    record = np.array([(candle_time, candle["open"], candle["high"], candle["low"], candle["close"],
+                        candle["volume"], candle["oi"])], dtype=CANDLE_RECORD)
+    return record.tobytes()
+
+
+def write_packed(pipe, candle_time: int, symbol: str, candle: dict, timeframe=BASE_TIMEFRAME):
+    """queue the candle's APPEND on pipe, a new or an amended candle alike; returns the key"""
+    key = packed_key(candle_time, symbol, timeframe)
+    pipe.append(key, pack_candle(candle_time, candle))
+    return key
+
+
+def _decode(raw: bytes, start=None, end=None):
+    """the key's records in time order, one per start time (the last one written), limited to start..end"""
+    records = np.frombuffer(raw[:len(raw) - len(raw) % CANDLE_RECORD.itemsize], dtype=CANDLE_RECORD)
+    if start is not None or end is not None:
+        t = records["t"]
+        records = records[(t >= (start or 0)) & (t <= (end if end is not None else np.iinfo(np.uint32).max))]
+    if len(records) > 1 and (np.diff(records["t"].astype(np.int64)) <= 0).any():
+        # amended candles: the first index of each t in the reversed records is its last write
+        _, last = np.unique(records["t"][::-1], return_index=True)
+        records = records[len(records) - 1 - last]
+    return records
+
+
+def read_packed(redis_client, date, symbol: str, timeframe=BASE_TIMEFRAME, start=None, end=None):
+    """structured array of the symbol's candles (CANDLE_RECORD), optionally limited to start..end epoch seconds.
+    redis_client must not decode responses."""
+    return read_packed_many(redis_client, date, [symbol], timeframe, start, end)[symbol]
+
+
+def read_packed_many(redis_client, date, symbols, timeframe=BASE_TIMEFRAME, start=None, end=None):
+    """{symbol: structured array}, one pipelined GET per symbol (a day is at most ~270 KB for a 3s symbol)"""
+    date = date.date() if isinstance(date, datetime.datetime) else date
+    with redis_client.pipeline(transaction=False) as pipe:
+        for symbol in symbols:
+            pipe.get(packed_key(date, symbol, timeframe))
+        return {symbol: _decode(raw or b"", start, end) for symbol, raw in zip(symbols, pipe.execute())}
+
+
+def to_frame(records):
+    """DataFrame with the columns of the json candles (date, open, high, low, close, oi, volume), None if empty"""
+    if not len(records):
+        return None
+    df = pd.DataFrame({
+        "date": pd.to_datetime(records["t"], unit="s", utc=True).tz_convert(_local_tz()).tz_localize(None),
+        **{field: np.round(records[field].astype(np.float64), 2) for field in ("open", "high", "low", "close")},
+        "oi": records["oi"].astype(np.int64),
+        "volume": records["volume"].astype(np.int64),
+    })
+    return df
+
+
+def _local_tz():
+    return datetime.datetime.now().astimezone().tzinfo
+
+
+def memory_report(redis_client, date, timeframe=BASE_TIMEFRAME, sample=200):
+    """
+    MEMORY USAGE of the json sorted sets against the packed strings for up to sample symbols of the day,
+    as bytes per symbol-day; symbols stored in only one of the two formats are left out.
+    """
+    date = date.date() if isinstance(date, datetime.datetime) else date
+    prefix = key_prefix(date, timeframe)
+    symbols = []
+    for key in redis_client.scan_iter(f"p{prefix}*", count=1000):
+        symbols.append((key.decode() if isinstance(key, bytes) else key)[len(prefix) + 1:])
+        if len(symbols) >= sample:
+            break
+    with redis_client.pipeline(transaction=False) as pipe:
+        for symbol in symbols:
+            pipe.memory_usage(candle_key(date, symbol, timeframe))
+            pipe.memory_usage(packed_key(date, symbol, timeframe))
+            pipe.zcard(candle_key(date, symbol, timeframe))
+        usage = pipe.execute()
+    rows = [usage[i:i + 3] for i in range(0, len(usage), 3)]
+    rows = [(json_bytes, packed_bytes, count) for json_bytes, packed_bytes, count in rows if json_bytes and packed_bytes]
+    if not rows:
+        return {"symbols": 0}
+    json_bytes, packed_bytes, candles = (sum(column) for column in zip(*rows))
+    return {
+        "symbols": len(rows),
+        "candles_per_symbol": round(candles / len(rows)),
+        "json_bytes_per_symbol_day": round(json_bytes / len(rows)),
+        "packed_bytes_per_symbol_day": round(packed_bytes / len(rows)),
+        "ratio": round(json_bytes / packed_bytes, 1),
+    }
+
+
+if __name__ == "__main__":
+    from common.config import get_redis_client_v2
+    print(memory_report(get_redis_client_v2(decode=False), datetime.date.today()))
@@ -0,0 +1,47 @@
+"""
+Process wide clock for services that follow market time.
+Live it is datetime.now(). With VIRTUAL_CLOCK=1 it follows the virtual time that s_stocks/tick_replay
+writes to redis, so TradingHours and the candle builders behave as they did on the replayed day.
+"""
+import datetime
+import os
+import time
+from common.config import get_redis_client_v2
+
+virtual_clock_key = "virtual_clock"
+
+
+class VirtualClock:
+    def __init__(self, redis_client=None, refresh=0.05):
+        self.redis = redis_client or get_redis_client_v2()
+        self.refresh = refresh  # seconds between redis reads
+        self.value = None
+        self.read_at = 0.0
+
+    def now(self):
+        if time.monotonic() - self.read_at > self.refresh:
+            epoch = self.redis.get(virtual_clock_key)
+            self.read_at = time.monotonic()
+            if epoch is not None:
+                self.value = datetime.datetime.fromtimestamp(float(epoch))
+        return self.value or datetime.datetime.now()
+
+    @staticmethod
+    def set(pipe, value: datetime.datetime):
+        pipe.set(virtual_clock_key, value.timestamp())
+
+
+_clock = VirtualClock() if os.environ.get("VIRTUAL_CLOCK") else None
+
+
+def now():
+    return _clock.now() if _clock else datetime.datetime.now()
+
+
+def monotonic():
+    """seconds for timing intervals: time.monotonic() live, virtual epoch seconds under replay (so --speed N scales)"""
+    return _clock.now().timestamp() if _clock else time.monotonic()
+
+
+def is_virtual():
+    return _clock is not None
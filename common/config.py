@@ -5,11 +5,43 @@ import yaml
 import platform
 
 server_url = 'http://100.86.138.85'
-redis_host = '100.86.138.85'
+redis_host = os.environ.get("REDIS_HOST", '100.86.138.85')  # local stand-in for tick replay
 #redis_host = '100.123.122.115' #e7270
 redis_port = 6379
 redis_db = 0
 redis_hash = "tick"
+tick_codec = os.environ.get("TICK_CODEC", "json")  # json | msgpack | struct (see common/tick_codec.py)
+tick_queue_maxlen = int(os.environ.get("TICK_QUEUE_MAXLEN", 5000))
+tick_queue_policy = os.environ.get("TICK_QUEUE_POLICY", "drop_oldest")  # drop_oldest | conflate | block (on_ticks conflates)
+tick_transport = os.environ.get("TICK_TRANSPORT", "list")  # list (LPUSH/BRPOP 'ticks') | stream (consumer groups)
+tick_stream_key = "tick_stream"
+tick_shards = int(os.environ.get("TICK_SHARDS", 1))  # KiteTicker connections, at most 3000 instruments each
+tick_atm_window = int(os.environ.get("TICK_ATM_WINDOW", 0))  # option strikes either side of ATM, 0 = all strikes
+tick_atm_hysteresis = float(os.environ.get("TICK_ATM_HYSTERESIS", 1.0))  # extra strike widths before re-centring
+# kite mode per instrument class (ltp | quote | full), all full unless opted in, e.g. TICK_MODES="equities=quote"
+tick_modes = dict(kv.split("=") for kv in os.environ.get("TICK_MODES", "").split(",") if kv)
+tick_near_strikes = int(os.environ.get("TICK_NEAR_STRIKES", 5))  # near-ATM options, in strike widths
+tick_stream_maxlen = int(os.environ.get("TICK_STREAM_MAXLEN", 200000))
+# stream consumer name, stable across container recreation so un-acked entries stay with it
+tick_stream_consumer = os.environ.get("TICK_STREAM_CONSUMER", "builder")
+tick_stream_start = os.environ.get("TICK_STREAM_START", "$")  # a new consumer group starts at $ (now) | 0 (all)
+candle_timeframes = [int(tf) for tf in os.environ.get("CANDLE_TIMEFRAMES", "3,15,60,300,900").split(",")]  # seconds
+candle_batch = int(os.environ.get("CANDLE_BATCH", 500))  # tick messages popped per round trip, 1 = one at a time
+candle_lateness = float(os.environ.get("CANDLE_LATENESS", 2))  # seconds past a bucket's end before it is closed
+candle_carry_forward = os.environ.get("CANDLE_CARRY_FORWARD", "0") == "1"  # flat candles for symbols with no trade
+candle_amend_window = int(os.environ.get("CANDLE_AMEND_WINDOW", 60))  # seconds a closed candle still takes late ticks
+# live candle format: json (sorted sets), packed (binary records, see common/candle_store.py) or both (the memory of
+# the two, to compare or move readers over); dynamic candles, and so the greek calc, need the json sets and refuse
+# to start with packed
+candle_store_format = os.environ.get("CANDLE_STORE", "json")
+# builder state saved every CANDLE_CHECKPOINT_SEC (0 = off) to redis, or to CANDLE_CHECKPOINT_DIR when set, and
+# restored on start within the same session
+candle_checkpoint_sec = float(os.environ.get("CANDLE_CHECKPOINT_SEC", 5))
+candle_checkpoint_dir = os.environ.get("CANDLE_CHECKPOINT_DIR")
+# candle builder processes, each owning crc32(symbol) % CANDLE_SHARDS == CANDLE_SHARD of ticks:{ix} / tick_stream:{ix}
+candle_shards = int(os.environ.get("CANDLE_SHARDS", 1))
+candle_shard = int(os.environ.get("CANDLE_SHARD", 0))
+tick_lease_ttl_ms = int(os.environ.get("TICK_LEASE_TTL_MS", 0))  # hot-standby ticker pair, 0 = single instance
 
 base_dir = Path(__file__).resolve().parent.parent
 base_dir_prv = Path(__file__).resolve().parent.parent.parent.parent / 'OneDrive/Algo'
@@ -20,10 +52,12 @@ bhavcopy_dir = base_dir_prv / 'bhavcopy'
 
 if Path('/.dockerenv').exists():
     parquet_dir = Path("/app/parquet")  # Docker path
+    tick_dir = Path("/app/tick_data")
     url_docker_db = "http://nginx/api/docker_db"
     url_ws = "ws://nginx/ws/"
 else:
     parquet_dir = base_dir_prv / 'screener/parquet'
+    tick_dir = base_dir_prv / 'screener/ticks'
     url_docker_db = f"{server_url}/api/docker_db"
     url_ws = f"{server_url.replace("http", "ws")}:5009/ws/"
 
@@ -0,0 +1,110 @@
+import datetime
+import io
+import threading
+import pandas as pd
+from common.config import get_redis_client_v2
+from common.my_logger import logger
+
+
+class InstrumentMaster:
+    """
+    Kite instrument dump cached once per trading day (parquet in redis, instruments:{YYYYMMDD}) and indexed
+    token <-> symbol <-> (name, expiry, strike, instrument_type). Symbols are exchange:tradingsymbol as in ticks.
+    common/expiry.Expiry keeps its rule calendar: its callers (HistQuote, archive, greek calc) also ask about past
+    dates, which a day's instrument listing cannot answer.
+    """
+    EXPIRE_TIME = 3 * 24 * 60 * 60
+    COLUMNS = ["instrument_token", "exchange", "tradingsymbol", "name", "expiry", "strike", "instrument_type",
+               "segment", "lot_size", "tick_size"]
+    _cache = {}  # date -> InstrumentMaster, shared in process
+    _lock = threading.Lock()
+    _redis = None  # one binary client for every lookup, created on first use
+
+    def __init__(self, df: pd.DataFrame, date: datetime.date):
+        self.date = date
+        self.df = df
+        self.token_to_symbol = dict(zip(df.instrument_token, df.symbol))
+        self.symbol_to_token = dict(zip(df.symbol, df.instrument_token))
+        self._rows = None
+        self._options = None
+
+    @staticmethod
+    def redis_key(date: datetime.date):
+        return f"instruments:{date:%Y%m%d}"
+
+    @classmethod
+    def get(cls, kite=None, date: datetime.date = None):
+        """today's master: process cache, then redis, then kite.instruments() when a kite client is given"""
+        date = date or datetime.date.today()
+        with cls._lock:
+            if date in cls._cache:
+                return cls._cache[date]
+            if cls._redis is None:
+                cls._redis = get_redis_client_v2(decode=False)
+            redis_client = cls._redis
+            if data := redis_client.get(cls.redis_key(date)):
+                df = pd.read_parquet(io.BytesIO(data))
+            elif kite is not None:
+                df = cls.download(kite)
+                buffer = io.BytesIO()
+                df.to_parquet(buffer, compression="zstd", index=False)
+                redis_client.set(cls.redis_key(date), buffer.getvalue(), ex=cls.EXPIRE_TIME)
+                logger.info(f"Cached {len(df)} kite instruments for {date:%Y%m%d}")
+            else:
+                return None
+            cls._cache = {date: cls(df, date)}  # previous days are dropped
+            return cls._cache[date]
+
+    @classmethod
+    def download(cls, kite):
+        df = pd.DataFrame(kite.instruments())
+        logger.info(f"Downloaded {len(df)} kite instruments")
+        df = df[cls.COLUMNS].copy()
+        df["expiry"] = pd.to_datetime(df["expiry"], errors="coerce")
+        df["symbol"] = df["exchange"] + ":" + df["tradingsymbol"]
+        return df
+
+    @property
+    def rows(self):
+        """symbol -> row dict, built on first use"""
+        if self._rows is None:
+            self._rows = self.df.set_index("symbol").to_dict("index")
+        return self._rows
+
+    @property
+    def options(self):
+        """(name, expiry date, strike, CE/PE) -> symbol"""
+        if self._options is None:
+            df = self.df[self.df.instrument_type.isin(["CE", "PE"])]
+            self._options = dict(zip(zip(df.name, df.expiry.dt.date, df.strike.astype(int), df.instrument_type),
+                                     df.symbol))
+        return self._options
+
+    def describe(self, symbol: str):
+        """name / expiry / strike / instrument_type / exp_str of a symbol, None if unknown"""
+        row = self.rows.get(symbol)
+        if row is None:
+            return None
+        info = {k: row[k] for k in ("instrument_token", "exchange", "name", "strike", "instrument_type", "lot_size")}
+        info["expiry"] = row["expiry"].date() if pd.notna(row["expiry"]) else None
+        if row["instrument_type"] in ("CE", "PE"):
+            # exp_str as embedded in the tradingsymbol, e.g. NIFTY25O07 -> 25O07 / NIFTY25OCT -> 25OCT
+            tradingsymbol, name = row["tradingsymbol"], row["name"]
+            strike = str(int(row["strike"])) if row["strike"] == int(row["strike"]) else str(row["strike"])
+            info["exp_str"] = tradingsymbol[len(name):-(len(strike) + 2)]
+            info["strike_str"] = strike
+        return info
+
+    def option_symbol(self, name: str, expiry: datetime.date, strike: int, opt_type: str):
+        return self.options.get((name, expiry, int(strike), opt_type))
+
+    def derivatives(self, names, exchanges, n_expiries=2):
+        """token -> symbol for the nearest n_expiries across names (as subscribed by KiteSocket)"""
+        df = self.df[self.df.name.isin(names) & self.df.exchange.isin(exchanges)]
+        min_dates = df.groupby("name")["expiry"].min()
+        df = df[df.expiry.isin(sorted(set(min_dates))[:n_expiries])]
+        return dict(zip(df.instrument_token, df.symbol))
+
+    def indices(self, tradingsymbols):
+        df = self.df[(self.df.segment == "INDICES") & self.df.tradingsymbol.isin(tradingsymbols)]
+        return dict(zip(df.instrument_token, df.symbol))
@@ -0,0 +1,121 @@
+import bisect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from common.my_logger import logger
+
+# bucket upper bounds in ms, roughly 12 per decade from 0.1ms to 120s
+BUCKETS_MS = [round(0.1 * 10 ** (i / 12), 4) for i in range(73)]
+
+
+class LatencyHistogram:
+    """fixed log-bucket histogram; O(1) record, percentiles read from the buckets"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.max = 0.0
+
+    def record(self, seconds):
+        ms = seconds * 1000
+        with self.lock:
+            self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+            self.count += 1
+            self.max = max(self.max, ms)
+
+    def percentile(self, q):
+        target = q * self.count
+        seen = 0
+        for ix, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                # a bucket's upper bound, never above what was actually seen
+                return min(BUCKETS_MS[ix], round(self.max, 2)) if ix < len(BUCKETS_MS) else round(self.max, 2)
+        return 0.0
+
+    def snapshot(self, reset=False):
+        with self.lock:
+            snap = {
+                "count": self.count,
+                "p50_ms": self.percentile(0.5),
+                "p99_ms": self.percentile(0.99),
+                "max_ms": round(self.max, 2),
+            }
+            if reset:
+                self.reset()
+            return snap
+
+
+class LatencyRecorder:
+    """
+    Per-stage latency of the tick pipeline for one service.
+    snapshot() feeds the service's /metrics endpoint; publish() sends it on telemetry_channel for the dashboards.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.stages = {}
+        self.window_start = time.time()
+
+    def record(self, stage, seconds):
+        if (hist := self.stages.get(stage)) is None:
+            hist = self.stages.setdefault(stage, LatencyHistogram())
+        hist.record(max(seconds, 0.0))
+
+    def record_since(self, stage, epoch):
+        self.record(stage, time.time() - epoch)
+
+    def snapshot(self, reset=False):
+        snap = {stage: hist.snapshot(reset=reset) for stage, hist in list(self.stages.items())}
+        window = time.time() - self.window_start
+        if reset:
+            self.window_start = time.time()
+        return {"source": self.source, "window_sec": round(window, 1), "latency": snap}
+
+    def publish(self, redis_client, reset=True):
+        payload = self.snapshot(reset=reset)
+        if any(s["count"] for s in payload["latency"].values()):
+            redis_client.publish("telemetry_channel", json.dumps(payload))
+
+    def start_publisher(self, redis_client, interval=5):
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.publish(redis_client)
+                except Exception as e:
+                    logger.error(f"latency telemetry error: {e}")
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+def serve_metrics(port, metrics):
+    """
+    GET /metrics -> metrics() as json, on a daemon thread, for services that run without a web app
+    (candles.py, dynamic_candles.py); the tmp_* flask apps serve the same dict on their own routes.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = json.dumps(metrics(), default=str).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # scraped every few seconds
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"metrics on :{port}/metrics")
+    return server
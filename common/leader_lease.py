@@ -0,0 +1,138 @@
+import json
+import os
+import socket
+import threading
+import time
+from common.my_logger import logger
+
+# only the holder may extend or drop the lease
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    redis.call('pexpire', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderLease:
+    """
+    Redis lease deciding which of several identical instances is active (SET NX PX, renewed by the holder only).
+    The leader renews every ttl/5 while healthy and drops the lease when it is not, so a standby takes over about
+    one ttl after the leader's last renewal. Each renewal stamps leader:{name}:renewed; the gap between that stamp
+    and a takeover is the failover time, kept in stats() and leader:{name}:failovers.
+    """
+    HISTORY = 100
+
+    def __init__(self, redis_client, name, ttl_ms=1000, holder=None):
+        self.redis = redis_client  # decode_responses=True
+        self.name = name
+        self.key = f"leader:{name}"
+        self.renewed_key = f"{self.key}:renewed"
+        self.failovers_key = f"{self.key}:failovers"
+        self.ttl_ms = ttl_ms
+        self.ttl = ttl_ms / 1000
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}"
+        self.renew_script = self.redis.register_script(RENEW_SCRIPT)
+        self.release_script = self.redis.register_script(RELEASE_SCRIPT)
+        self.is_leader = False
+        self.takeovers = 0
+        self.last_failover_ms = None
+        self.max_failover_ms = 0.0
+        self.stop_event = threading.Event()
+
+    def _stamp(self, pipe):
+        pipe.hset(self.renewed_key, mapping={"holder": self.holder, "ts": time.time()})
+
+    def try_acquire(self):
+        if not self.redis.set(self.key, self.holder, nx=True, px=self.ttl_ms):
+            return False
+        acquired = time.time()
+        previous = self.redis.hgetall(self.renewed_key)
+        with self.redis.pipeline() as pipe:
+            self._stamp(pipe)
+            if previous.get("holder") and previous["holder"] != self.holder:
+                failover_ms = (acquired - float(previous["ts"])) * 1000
+                self.last_failover_ms = round(failover_ms, 1)
+                self.max_failover_ms = max(self.max_failover_ms, self.last_failover_ms)
+                record = {"holder": self.holder, "previous": previous["holder"], "failover_ms": self.last_failover_ms,
+                          "at": acquired}
+                pipe.lpush(self.failovers_key, json.dumps(record))
+                pipe.ltrim(self.failovers_key, 0, self.HISTORY - 1)
+                logger.warning(f"{self.holder} took over {self.key} from {previous['holder']} "
+                               f"after {self.last_failover_ms:.0f}ms")
+            else:
+                logger.info(f"{self.holder} acquired {self.key}")
+            pipe.execute()
+        self.takeovers += 1
+        self.is_leader = True
+        return True
+
+    def renew(self):
+        if not self.renew_script(keys=[self.key], args=[self.holder, self.ttl_ms]):
+            logger.warning(f"{self.holder} lost {self.key}")
+            self.is_leader = False
+            return False
+        with self.redis.pipeline() as pipe:
+            self._stamp(pipe)
+            pipe.execute()
+        return True
+
+    def release(self):
+        if self.is_leader:
+            logger.info(f"{self.holder} releasing {self.key}")
+        self.is_leader = False
+        try:
+            self.release_script(keys=[self.key], args=[self.holder])
+        except Exception as e:
+            logger.error(f"lease release error: {e}")
+
+    def step(self, healthy=True):
+        """one round of the lease loop: renew / acquire while healthy, give the lease up when not"""
+        if not healthy:
+            if self.is_leader:
+                self.release()
+        elif self.is_leader:
+            self.renew()
+        else:
+            self.try_acquire()
+        return self.is_leader
+
+    def run(self, healthy=lambda: True):
+        interval = self.ttl / 5
+        while not self.stop_event.is_set():
+            try:
+                self.step(healthy())
+            except Exception as e:
+                # cannot tell whether the lease is still ours, so stop acting as leader until redis answers
+                logger.error(f"lease error: {e}")
+                self.is_leader = False
+            self.stop_event.wait(interval)
+
+    def start(self, healthy=lambda: True):
+        threading.Thread(target=self.run, args=(healthy,), daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.release()
+
+    def current(self):
+        return self.redis.get(self.key)
+
+    def failovers(self, count=10):
+        return [json.loads(r) for r in self.redis.lrange(self.failovers_key, 0, count - 1)]
+
+    def stats(self):
+        return {
+            "holder": self.holder,
+            "role": "leader" if self.is_leader else "standby",
+            "takeovers": self.takeovers,
+            "last_failover_ms": self.last_failover_ms,
+            "max_failover_ms": round(self.max_failover_ms, 1),
+        }
@@ -0,0 +1,54 @@
+import datetime
+import pytest
+from common import clock
+from common.trading_hours import TradingHours
+
+legacy = pytest.importorskip("common_library.trading.trading_hours")
+
+BUFFERS = [(0, 0), (0, 30), (0, 60), (60, 0)]  # (start_buffer, end_buffer) the services use
+TIMES = [datetime.time(h, m, s) for h, m, s in
+         [(0, 0, 0), (9, 0, 0), (9, 14, 59), (9, 15, 0), (9, 15, 1), (12, 0, 0), (15, 29, 59), (15, 30, 0),
+          (15, 30, 29), (15, 30, 30), (15, 31, 0), (23, 59, 59)]]
+
+
+class FrozenDatetime(datetime.datetime):
+    frozen = datetime.datetime(2026, 1, 5, 12, 0)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.frozen
+
+    @classmethod
+    def today(cls):
+        return cls.frozen
+
+
+def probe_days(holidays):
+    """three weeks of weekdays and weekends, plus each holiday and the days either side of it"""
+    days = {datetime.date(2025, 12, 15) + datetime.timedelta(days=i) for i in range(21)}
+    for holiday in sorted(holidays)[-40:]:
+        day = datetime.date.fromisoformat(holiday)
+        days |= {day - datetime.timedelta(days=1), day, day + datetime.timedelta(days=1)}
+    return sorted(days)
+
+
+def observe(trading_hours):
+    return (trading_hours.is_open(), trading_hours.get_market_close_time(), trading_hours.time_until_close(),
+            trading_hours.time_until_next_open())
+
+
+@pytest.mark.parametrize("start_buffer, end_buffer", BUFFERS)
+def test_matches_common_library(monkeypatch, start_buffer, end_buffer):
+    """common.trading_hours replaced common_library's class in candles, dynamic_candles and data_poller"""
+    monkeypatch.setattr(legacy, "datetime", FrozenDatetime)
+    old = legacy.TradingHours(start_buffer=start_buffer, end_buffer=end_buffer)
+    new = TradingHours(start_buffer=start_buffer, end_buffer=end_buffer)
+    assert (new.start, new.end) == (old.start, old.end)
+    assert new.holidays == old.holidays
+
+    for day in probe_days(old.holidays):
+        assert new.is_holiday(day) == old.is_holiday(day), day
+        for time_ in TIMES:
+            now = FrozenDatetime.frozen = FrozenDatetime.combine(day, time_)
+            monkeypatch.setattr(clock, "now", lambda: now)
+            assert observe(new) == observe(old), now
@@ -0,0 +1,211 @@
+import datetime
+import json
+import struct
+import time
+from common.config import tick_codec as default_codec_name
+
+try:
+    import msgpack
+except ImportError:  # optional, only needed for the msgpack codec
+    msgpack = None
+
+
+def parse_timestamp(value):
+    """exchange_timestamp / last_trade_time as datetime, whatever the codec produced"""
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value)
+    return datetime.datetime.fromisoformat(value)
+
+
+class JsonTickCodec:
+    """Current wire format: {symbol: tick} as JSON, datetimes via str()"""
+    name = "json"
+    binary = False
+
+    @staticmethod
+    def encode_batch(ticks: dict):
+        return json.dumps(ticks, default=str)
+
+    @staticmethod
+    def decode_batch(payload):
+        return json.loads(payload)
+
+    @staticmethod
+    def encode_tick(tick: dict):
+        return json.dumps(tick, default=str)
+
+    @staticmethod
+    def decode_tick(payload):
+        return json.loads(payload)
+
+
+class MsgpackTickCodec:
+    """Same structure as json, msgpack encoded. Datetimes are kept as str() so consumers see identical ticks"""
+    name = "msgpack"
+    binary = True
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("msgpack codec selected but msgpack is not installed")
+
+    @staticmethod
+    def encode_batch(ticks: dict):
+        return msgpack.packb(ticks, default=str)
+
+    @staticmethod
+    def decode_batch(payload):
+        return msgpack.unpackb(payload)
+
+    encode_tick = encode_batch
+    decode_tick = decode_batch
+
+
+class StructTickCodec:
+    """
+    Fixed struct layout for the numeric kite tick fields.
+    record: symbol_len(B) symbol mask(H) mode(B) fields depth(optional, 5x buy + 5x sell of qty/price/orders)
+    mask marks which fields were present so a decoded tick has the same keys as the original
+    """
+    name = "struct"
+    binary = True
+
+    FIELDS = ("instrument_token", "last_price", "last_traded_quantity", "average_traded_price", "volume_traded",
+              "total_buy_quantity", "total_sell_quantity", "change", "oi", "oi_day_high", "oi_day_low",
+              "last_trade_time", "exchange_timestamp")
+    TIME_FIELDS = {"last_trade_time", "exchange_timestamp"}
+    OHLC_FIELDS = ("open", "high", "low", "close")
+    BODY = struct.Struct("<HBI d I d Q Q Q d Q Q Q d d dddd".replace(" ", ""))
+    DEPTH = struct.Struct("<" + "IdH" * 10)
+    COUNT = struct.Struct("<H")
+    MODES = ("ltp", "quote", "full")
+    TRADABLE_BIT = 1 << 13
+    OHLC_BIT = 1 << 14
+    DEPTH_BIT = 1 << 15
+    EMPTY_LEVEL = {"quantity": 0, "price": 0, "orders": 0}
+
+    def _encode_record(self, symbol: str, tick: dict):
+        mask = self.TRADABLE_BIT if tick.get("tradable") else 0
+        ohlc = tick.get("ohlc")
+        if ohlc is not None:
+            mask |= self.OHLC_BIT
+        values = []
+        for ix, field in enumerate(self.FIELDS):
+            value = tick.get(field)
+            if value is None:
+                values.append(0)
+                continue
+            mask |= 1 << ix
+            if field in self.TIME_FIELDS:
+                value = value.timestamp() if isinstance(value, datetime.datetime) else parse_timestamp(
+                    value).timestamp()
+            values.append(value)
+        values.extend((ohlc or {}).get(k, 0) for k in self.OHLC_FIELDS)
+
+        depth = tick.get("depth")
+        if depth:
+            mask |= self.DEPTH_BIT
+        mode = self.MODES.index(tick["mode"]) if tick.get("mode") in self.MODES else 255
+        symbol_bytes = symbol.encode()
+        record = bytes((len(symbol_bytes),)) + symbol_bytes + self.BODY.pack(mask, mode, *values)
+        if depth:
+            record += self.DEPTH.pack(*(
+                v for side in ("buy", "sell") for level in (depth[side] + [self.EMPTY_LEVEL] * 5)[:5]
+                for v in (level["quantity"], level["price"], level["orders"])))
+        return record
+
+    def _decode_record(self, payload, offset=0):
+        symbol_len = payload[offset]
+        offset += 1
+        symbol = payload[offset:offset + symbol_len].decode()
+        offset += symbol_len
+        mask, mode, *values = self.BODY.unpack_from(payload, offset)
+        offset += self.BODY.size
+
+        tick = {"tradable": bool(mask & self.TRADABLE_BIT)}
+        if mode != 255:
+            tick["mode"] = self.MODES[mode]
+        for ix, field in enumerate(self.FIELDS):
+            if mask & (1 << ix):
+                value = values[ix]
+                tick[field] = str(datetime.datetime.fromtimestamp(value)) if field in self.TIME_FIELDS else value
+        if mask & self.OHLC_BIT:
+            tick["ohlc"] = dict(zip(self.OHLC_FIELDS, values[len(self.FIELDS):]))
+        if mask & self.DEPTH_BIT:
+            flat = self.DEPTH.unpack_from(payload, offset)
+            offset += self.DEPTH.size
+            levels = [{"quantity": flat[i], "price": flat[i + 1], "orders": flat[i + 2]} for i in range(0, 30, 3)]
+            tick["depth"] = {"buy": levels[:5], "sell": levels[5:]}
+        return symbol, tick, offset
+
+    def encode_tick(self, tick: dict):
+        return self._encode_record("", tick)
+
+    def decode_tick(self, payload):
+        return self._decode_record(payload)[1]
+
+    def encode_batch(self, ticks: dict):
+        return self.COUNT.pack(len(ticks)) + b"".join(self._encode_record(s, t) for s, t in ticks.items())
+
+    def decode_batch(self, payload):
+        (count,) = self.COUNT.unpack_from(payload, 0)
+        offset = self.COUNT.size
+        ticks = {}
+        for _ in range(count):
+            symbol, tick, offset = self._decode_record(payload, offset)
+            ticks[symbol] = tick
+        return ticks
+
+
+codecs = {c.name: c for c in (JsonTickCodec, MsgpackTickCodec, StructTickCodec)}
+
+
+def get_tick_codec(name: str = None):
+    """codec from common.config.tick_codec (TICK_CODEC env) unless named explicitly"""
+    name = name or default_codec_name
+    if name not in codecs:
+        raise ValueError(f"unknown tick codec '{name}', expected one of {list(codecs)}")
+    return codecs[name]()
+
+
+def sample_batch(n_symbols=3000):
+    now = datetime.datetime.now().replace(microsecond=0)
+    level = {"quantity": 75, "price": 101.5, "orders": 3}
+    tick = {
+        "tradable": True, "mode": "full", "instrument_token": 12345678, "last_price": 101.55,
+        "last_traded_quantity": 75, "average_traded_price": 99.87, "volume_traded": 12345675,
+        "total_buy_quantity": 456000, "total_sell_quantity": 398000,
+        "ohlc": {"open": 95.0, "high": 110.2, "low": 90.05, "close": 97.4},
+        "change": 4.26, "last_trade_time": now, "oi": 5678925, "oi_day_high": 6000000, "oi_day_low": 5000000,
+        "exchange_timestamp": now, "depth": {"buy": [level] * 5, "sell": [level] * 5},
+    }
+    return {f"NFO:NIFTY25O07{24000 + 50 * i}CE": dict(tick, instrument_token=tick["instrument_token"] + i)
+            for i in range(n_symbols)}
+
+
+def benchmark(n_symbols=3000, rounds=20):
+    ticks = sample_batch(n_symbols)
+    rows = []
+    for name, codec_cls in codecs.items():
+        try:
+            codec = codec_cls()
+        except ImportError as e:
+            rows.append(f"{name:>8} | skipped: {e}")
+            continue
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            payload = codec.encode_batch(ticks)
+        t1 = time.perf_counter()
+        for _ in range(rounds):
+            codec.decode_batch(payload)
+        t2 = time.perf_counter()
+        per_tick = rounds * n_symbols / 1e6
+        size = len(payload.encode() if isinstance(payload, str) else payload)
+        rows.append(f"{name:>8} | {size / n_symbols:8.1f} bytes/tick | encode {(t1 - t0) / per_tick:6.2f} µs/tick"
+                    f" | decode {(t2 - t1) / per_tick:6.2f} µs/tick")
+    return rows
+
+
+if __name__ == "__main__":
+    print("\n".join(benchmark()))
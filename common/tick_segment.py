@@ -0,0 +1,148 @@
+"""
+Day segmented on-disk tick store.
+{tick_dir}/{YYYYMMDD}/seg_{HHMMSS_ffffff}.tseg   append-only fixed size records (RECORD_DTYPE), one file per recorder run
+{tick_dir}/{YYYYMMDD}/seg_{HHMMSS_ffffff}.json   symbol table for the segment (sym_id -> symbol)
+{tick_dir}/{YYYYMMDD}/ticks_{YYYYMMDD}.parquet   columnar compaction of all the day's segments
+"""
+import datetime
+import json
+import os
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from common.config import tick_dir
+from common.tick_codec import parse_timestamp
+
+RECORD_DTYPE = np.dtype([
+    ("sym_id", "<u4"),
+    ("exchange_ts", "<f8"),  # epoch seconds
+    ("recv_ts", "<f8"),
+    ("last_price", "<f8"),
+    ("last_qty", "<u4"),
+    ("avg_price", "<f8"),
+    ("volume", "<u8"),
+    ("buy_qty", "<u8"),
+    ("sell_qty", "<u8"),
+    ("oi", "<u8"),
+])
+SEGMENT_SUFFIX = ".tseg"
+
+
+def day_dir(date: datetime.date):
+    return Path(tick_dir) / f"{date:%Y%m%d}"
+
+
+class SegmentWriter:
+    """Appends decoded tick batches ({symbol: tick}) to a new segment file"""
+
+    def __init__(self, date: datetime.date):
+        self.date = date
+        directory = day_dir(date)
+        directory.mkdir(parents=True, exist_ok=True)
+        stem = f"seg_{datetime.datetime.now():%H%M%S_%f}"
+        self.path = directory / f"{stem}{SEGMENT_SUFFIX}"
+        self.symbols_path = directory / f"{stem}.json"
+        self.symbol_ids = {}
+        self.file = open(self.path, "xb")  # never reopen a segment: its symbol ids belong to another run
+        self.records = 0
+
+    def _save_symbols(self):
+        tmp = self.symbols_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(list(self.symbol_ids)))
+        os.replace(tmp, self.symbols_path)
+
+    @staticmethod
+    def _epoch(value):
+        value = parse_timestamp(value)
+        return value.timestamp() if value else 0
+
+    def write(self, ticks: dict, recv_ts=None):
+        recv_ts = recv_ts or time.time()
+        known = len(self.symbol_ids)
+        rows = np.array([(
+            self.symbol_ids.setdefault(symbol, len(self.symbol_ids)),
+            self._epoch(tick.get("exchange_timestamp")),
+            recv_ts,
+            tick.get("last_price") or 0,
+            tick.get("last_traded_quantity") or 0,
+            tick.get("average_traded_price") or 0,
+            tick.get("volume_traded") or 0,
+            tick.get("total_buy_quantity") or 0,
+            tick.get("total_sell_quantity") or 0,
+            tick.get("oi") or 0,
+        ) for symbol, tick in ticks.items()], dtype=RECORD_DTYPE)
+        if len(self.symbol_ids) != known:
+            self._save_symbols()  # before the records that reference the new ids
+        self.file.write(rows.tobytes())
+        self.file.flush()
+        self.records += len(rows)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+class SegmentReader:
+    """
+    Read-only memory map over one day's segments.
+    records(ix) is a zero-copy view of a whole segment; symbol() gathers one symbol's rows across segments.
+    """
+
+    def __init__(self, date: datetime.date):
+        self.date = date
+        self.segments = []  # (memmap, symbols)
+        for path in sorted(day_dir(date).glob(f"*{SEGMENT_SUFFIX}")):
+            # a torn trailing record from a crash is ignored
+            count = path.stat().st_size // RECORD_DTYPE.itemsize
+            if not count:
+                continue
+            records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", shape=(count,))
+            symbols = json.loads(path.with_suffix(".json").read_text())
+            self.segments.append((records, symbols))
+        self._index = {}
+
+    def symbols(self):
+        return sorted({s for _, symbols in self.segments for s in symbols})
+
+    def records(self, ix=0):
+        return self.segments[ix][0]
+
+    def symbol(self, symbol: str):
+        """structured array (RECORD_DTYPE) of every tick for symbol, in arrival order"""
+        parts = []
+        for seg_ix, (records, symbols) in enumerate(self.segments):
+            if symbol not in symbols:
+                continue
+            key = (seg_ix, symbol)
+            if key not in self._index:
+                self._index[key] = np.flatnonzero(records["sym_id"] == symbols.index(symbol))
+            parts.append(records[self._index[key]])
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=RECORD_DTYPE)
+
+    def column(self, symbol: str, field: str):
+        return self.symbol(symbol)[field]
+
+
+def compact_day(date: datetime.date, remove_segments=False):
+    """merge the day's segments into ticks_{YYYYMMDD}.parquet sorted by symbol, exchange time"""
+    reader = SegmentReader(date)
+    if not reader.segments:
+        return None
+    frames = []
+    for records, symbols in reader.segments:
+        df = pd.DataFrame(np.asarray(records))
+        df.insert(0, "symbol", pd.Categorical.from_codes(df.pop("sym_id"), categories=symbols))
+        frames.append(df)
+    df = pd.concat(frames, ignore_index=True)
+    df["symbol"] = df["symbol"].astype(str)
+    df = df.sort_values(["symbol", "exchange_ts"], kind="stable", ignore_index=True)
+
+    path = day_dir(date) / f"ticks_{date:%Y%m%d}.parquet"
+    df.to_parquet(path, compression="zstd", index=False)
+    if remove_segments:
+        for records, _ in reader.segments:
+            segment = Path(records.filename)
+            segment.unlink(missing_ok=True)
+            segment.with_suffix(".json").unlink(missing_ok=True)
+    return path
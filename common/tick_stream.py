@@ -0,0 +1,125 @@
+import zlib
+import redis
+from common.config import tick_stream_key, tick_stream_maxlen, tick_transport, candle_shards
+from common.config import tick_stream_consumer, tick_stream_start
+from common.my_logger import logger
+
+TICK_LIST_KEY = "ticks"
+
+
+def publish_tick(pipe, payload, stream=tick_stream_key):
+    """capped XADD of one encoded tick batch (see common/tick_codec.py)"""
+    pipe.xadd(stream, {"data": payload}, maxlen=tick_stream_maxlen, approximate=True)
+
+
+def tick_shard(symbol: str, n_shards=candle_shards):
+    """stable symbol partition, the same in every process (unlike hash())"""
+    return zlib.crc32(symbol.encode()) % n_shards
+
+
+def shard_key(key: str, shard: int, n_shards=candle_shards):
+    return key if n_shards <= 1 else f"{key}:{shard}"
+
+
+def tick_queue_key(shard=0, n_shards=candle_shards):
+    """the candle builders' input: 'ticks' list or tick_stream, per shard when sharded"""
+    return shard_key(TICK_LIST_KEY if tick_transport == "list" else tick_stream_key, shard, n_shards)
+
+
+def queue_ticks(pipe, ticks: dict, codec, payload=None, n_shards=candle_shards):
+    """
+    push one {symbol: tick} batch for the candle builders, split by tick_shard when CANDLE_SHARDS > 1 so each
+    builder pops only its own symbols; payload: the batch already encoded, reused when unsharded.
+    Returns the keys written.
+    """
+    if n_shards <= 1:
+        parts = {0: payload if payload is not None else codec.encode_batch(ticks)}
+    else:
+        split = {}
+        for symbol, tick in ticks.items():
+            split.setdefault(tick_shard(symbol, n_shards), {})[symbol] = tick
+        parts = {shard: codec.encode_batch(part) for shard, part in split.items()}
+
+    keys = []
+    for shard, part_payload in parts.items():
+        key = tick_queue_key(shard, n_shards)
+        if tick_transport == "list":
+            pipe.lpush(key, part_payload)
+        else:
+            publish_tick(pipe, part_payload, stream=key)
+        keys.append(key)
+    return keys
+
+
+class TickStreamConsumer:
+    """
+    Consumer group reader for the tick stream.
+    Each group gets every tick once; consumers inside a group share the load.
+    The consumer name is stable (TICK_STREAM_CONSUMER), so a recreated container owns the entries its previous run
+    left un-acked. On start it also claims entries idle for claim_idle_ms under any other consumer (e.g. one named
+    by an older deploy), then re-reads its own pending entries before new ones, so a crash does not lose in-flight
+    ticks. A group that does not exist yet starts at start_id: "$" only takes ticks published from now on.
+    """
+
+    def __init__(self, redis_client, group, consumer=tick_stream_consumer, count=200, block_ms=1000,
+                 stream=tick_stream_key, start_id=tick_stream_start, claim_idle_ms=30000):
+        self.redis = redis_client
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer
+        self.count = count
+        self.block_ms = block_ms
+        self.last_id = "0"  # pending entries first, then ">" for new ones
+        self.claimed = 0
+        self.ensure_group(start_id)
+        self.claim_idle(claim_idle_ms)
+
+    def ensure_group(self, start_id="0"):
+        try:
+            self.redis.xgroup_create(self.stream, self.group, id=start_id, mkstream=True)
+            logger.info(f"created consumer group {self.group} on {self.stream} at {start_id}")
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def claim_idle(self, min_idle_ms):
+        """XAUTOCLAIM every pending entry idle for min_idle_ms, they are then read as this consumer's own"""
+        cursor = "0-0"
+        while True:
+            response = self.redis.xautoclaim(self.stream, self.group, self.consumer, min_idle_time=min_idle_ms,
+                                             start_id=cursor, count=1000)
+            cursor, entries = response[0], response[1]
+            self.claimed += len(entries)
+            if cursor in ("0-0", b"0-0") or not entries:
+                break
+        if self.claimed:
+            logger.info(f"{self.consumer} claimed {self.claimed} idle pending entries of {self.group} on {self.stream}")
+
+    def read(self):
+        """[(entry_id, payload)], at most count entries, blocks up to block_ms when idle"""
+        block = None if self.last_id == "0" else self.block_ms
+        try:
+            response = self.redis.xreadgroup(self.group, self.consumer, {self.stream: self.last_id},
+                                             count=self.count, block=block)
+        except redis.ResponseError as e:
+            if "NOGROUP" not in str(e):  # stream deleted / expired under us
+                raise
+            self.ensure_group()  # a recreated stream holds only ticks published since, read all of it
+            return []
+
+        entries = response[0][1] if response else []
+        if self.last_id == "0" and len(entries) < self.count:
+            self.last_id = ">"  # pending backlog drained
+        # fields is empty / None for pending ids that were already trimmed from the capped stream
+        return [(entry_id, (fields or {}).get("data", (fields or {}).get(b"data"))) for entry_id, fields in entries]
+
+    def ack(self, entry_ids):
+        if entry_ids:
+            self.redis.xack(self.stream, self.group, *entry_ids)
+
+    def lag(self):
+        """entries not yet delivered to the group, None on redis < 7"""
+        for group in self.redis.xinfo_groups(self.stream):
+            name = group.get("name", group.get(b"name"))
+            if name in (self.group, self.group.encode()):
+                return group.get("lag", group.get(b"lag"))
@@ -1,6 +1,7 @@
 from datetime import datetime, time, timedelta
 import json
 from common.config import data_dir
+from common import clock
 
 
 class TradingHours:
@@ -24,21 +25,21 @@ class TradingHours:
         return date.strftime("%Y-%m-%d") in self.holidays
 
     def is_open(self):
-        now = datetime.now()
+        now = clock.now()
         if now.weekday() >= 5 or self.is_holiday(now):
             return False
         return self.start <= now.time() < self.end
 
     def get_market_close_time(self):
-        return datetime.combine(datetime.now().date(), self.end)
+        return datetime.combine(clock.now().date(), self.end)
 
     def time_until_close(self):
-        now = datetime.now()
+        now = clock.now()
         if self.is_open():
             return datetime.combine(now.date(), self.end) - now
 
     def time_until_next_open(self):
-        now = datetime.now()
+        now = clock.now()
         if now.time() < self.start and now.weekday() < 5 and not self.is_holiday(now):
             return datetime.combine(now.date(), self.start) - now
 
@@ -1,8 +1,7 @@
 from common.my_logger import logger
-from common_library.trading.trading_hours import TradingHours
+from common.trading_hours import TradingHours  # honours the replay virtual clock
 from common.config import get_redis_client_v2
 import asyncio
-import datetime
 import pandas as pd
 import websockets
 import json
@@ -12,6 +11,9 @@ from neo import Neo
 from common.config import get_broker_ids, url_ws
 import re
 from common.expiry import Expiry
+from common.tick_codec import parse_timestamp
+from common.instruments import InstrumentMaster
+from common import clock
 import logging
 
 logger.setLevel(logging.INFO)
@@ -30,6 +32,7 @@ class DataPoller:
         self.redis = None
         self.ws_task = None
         self.test_outside_hours = False
+        self.master = None  # today's InstrumentMaster, loaded once per session off the event loop
 
     async def get_brokers(self):
         brokers = []
@@ -55,6 +58,7 @@ class DataPoller:
 
             self.redis = await get_redis_client_v2(asyncio=True, port_ix=0)
             self.brokers = await self.get_brokers()
+            self.master = await asyncio.to_thread(self.load_master)
 
             logger.info("📈✅ Market open — starting data polling and WebSocket tick receiver.")
             self.ws_task = asyncio.create_task(self.receive_market_ticks())
@@ -145,7 +149,7 @@ class DataPoller:
 
     async def wait_until_market_opens(self):
         logger.info(f"📉⛔ Market closed. Sleeping in short bursts until "
-                    f"{(datetime.datetime.now() + self.trading_hours.time_until_next_open()):%d-%b-%Y %H:%M}")
+                    f"{(clock.now() + self.trading_hours.time_until_next_open()):%d-%b-%Y %H:%M}")
 
         while not self.trading_hours.is_open():
             remaining = self.trading_hours.time_until_next_open().total_seconds()
@@ -172,6 +176,16 @@ class DataPoller:
         if msg_type == "tick":
             self.process_tick_data(data)
 
+    @staticmethod
+    def load_master():
+        """today's instrument master with its symbol index built (~100k rows), None before ticks has cached it"""
+        master = InstrumentMaster.get()
+        if master is None:
+            logger.warning("Instrument master not cached yet, option ticks are parsed from their symbols")
+        else:
+            _ = master.rows
+        return master
+
     def process_tick_data(self, tick_updates):
         for symbol, tick_data in tick_updates.items():
             if symbol not in self.ticks:
@@ -180,20 +194,24 @@ class DataPoller:
                 if exchange in ("NFO", "BFO") and symbol[-3:].upper() != "FUT":
                     e = Expiry({"NFO": "NN", "BFO": "SX"}[exchange])
                     dd = e.get_derivative_data()
-                    match = re.match(r"^([A-Z]+)(\d.{4})(.*)(..)$", symbol[4:])
-                    # symbol_part = match.group(1)  # String till first digit
-                    exp_str = match.group(2)  # First digit + next 4 characters
-                    strike = match.group(3)  # Balance characters excluding last two
-                    opt_type = match.group(4)  # Last two characters
+                    if self.master and (info := self.master.describe(symbol)) and info["expiry"]:
+                        expiry_date, strike, opt_type = info["expiry"], info["strike"], info["instrument_type"]
+                    else:
+                        match = re.match(r"^([A-Z]+)(\d.{4})(.*)(..)$", symbol[4:])
+                        # symbol_part = match.group(1)  # String till first digit
+                        exp_str = match.group(2)  # First digit + next 4 characters
+                        strike = match.group(3)  # Balance characters excluding last two
+                        opt_type = match.group(4)  # Last two characters
+                        expiry_date = e.expand_exp_str(exp_str)
                     self.ticks[symbol].update({
                         'underlying': f'{dd["exchange"]}:{dd["underlying"]}',
-                        'expiry_date': e.expand_exp_str(exp_str),
+                        'expiry_date': expiry_date,
                         'strike': int(strike),
                         'opt_type': opt_type,
                     })
             self.ticks[symbol].update({
                 'last_price': tick_data['last_price'],
-                'timestamp': datetime.datetime.fromisoformat(tick_data['exchange_timestamp']),
+                'timestamp': parse_timestamp(tick_data.get('exchange_timestamp')),  # absent in quote mode
                 'tick': tick_data,
             })
 
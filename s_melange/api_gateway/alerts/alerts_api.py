@@ -4,6 +4,7 @@ from common.config import get_redis_client
 import datetime, time, threading, uuid, json, re
 from common.trading_hours import TradingHours
 from common.my_logger import logger
+from common.instruments import InstrumentMaster
 
 router = APIRouter(prefix="/alerts1/api", tags=["alerts-api"])
 redis_client = get_redis_client()
@@ -25,6 +26,7 @@ OPERATORS = {
 @router.get("/symbols")
 def get_symbols():
     symbols = redis_client.hkeys(get_redis_key())
+    master = InstrumentMaster.get()  # cached by the ticks service, None before its first connect of the day
     exchanges = {}
     for symbol in symbols:
         if ":" in symbol:
@@ -34,6 +36,10 @@ def get_symbols():
             if exchange in ("NSE", "BSE"):
                 exchanges[exchange].setdefault("symbols", []).append(sym)
                 continue
+            if master and (info := master.describe(symbol)) and "exp_str" in info:
+                exchanges[exchange].setdefault(info["name"], {}).setdefault(info["exp_str"], {}).setdefault(
+                    info["strike_str"], []).append(info["instrument_type"])
+                continue
             try:
                 match = re.match(r"^([A-Z]+)(\d.{4})(.*)(..)$", sym)
                 if not match:
@@ -1,7 +1,10 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 import asyncio
 import json
-from common.config import get_redis_client_async
+import time
+from common.config import get_redis_client_v2
+from common.tick_codec import get_tick_codec, parse_timestamp
+from common.latency import LatencyRecorder
 from common.my_logger import logger
 from redis.asyncio.connection import ConnectionError as RedisConnectionError
 from redis.exceptions import ConnectionError as SyncRedisConnectionError
@@ -28,6 +31,9 @@ class ClientStream:
 
 active_clients: set[ClientStream] = set()
 redis_task = None  # Task handle for Redis listener
+tick_codec = get_tick_codec()
+latency = LatencyRecorder("trade_socket")
+LATENCY_PUBLISH_SEC = 5
 
 
 @router.get("/check")
@@ -35,6 +41,11 @@ def ws_check():
     return {"message": "checked"}
 
 
+@router.get("/metrics")
+def ws_metrics():
+    return latency.snapshot()
+
+
 @router.websocket("/")
 async def websocket_endpoint(websocket: WebSocket):
     global redis_task
@@ -69,8 +80,15 @@ async def websocket_endpoint(websocket: WebSocket):
                 logger.info("Redis listener cancelled cleanly")
 
 
+def newest_exchange_epoch(ticks: dict):
+    stamps = [parse_timestamp(tick.get("exchange_timestamp")) for tick in ticks.values()]
+    return max((ts.timestamp() for ts in stamps if ts), default=None)
+
+
 async def redis_listener():
-    redis_client = await get_redis_client_async()
+    # binary tick codecs need a raw connection; channel names then arrive as bytes
+    redis_client = get_redis_client_v2(asyncio=True, decode=not tick_codec.binary)
+    last_publish = time.time()
     try:
         pubsub = redis_client.pubsub()
         await pubsub.subscribe(*channel_to_type.keys())
@@ -79,9 +97,16 @@ async def redis_listener():
             if msg["type"] != "message":
                 continue
 
+            if time.time() - last_publish >= LATENCY_PUBLISH_SEC:
+                last_publish = time.time()
+                snapshot = latency.snapshot(reset=True)
+                if any(s["count"] for s in snapshot["latency"].values()):
+                    await redis_client.publish("telemetry_channel", json.dumps(snapshot))
+
             try:
-                msg_type = channel_to_type.get(msg["channel"])
-                data = json.loads(msg["data"])
+                channel = msg["channel"]
+                msg_type = channel_to_type.get(channel.decode() if isinstance(channel, bytes) else channel)
+                data = tick_codec.decode_batch(msg["data"]) if msg_type == "tick" else json.loads(msg["data"])
                 wrapped_msg = {"type": msg_type, "data": data}
             except Exception as parse_error:
                 logger.warning(f"Skipping malformed message: {parse_error}")
@@ -99,6 +124,9 @@ async def redis_listener():
                     logger.warning(f"Queue error: {queue_error}")
                     active_clients.discard(client)
 
+            if msg_type == "tick" and (newest := newest_exchange_epoch(data)):
+                latency.record_since("exchange_to_push", newest)
+
     except (RedisConnectionError, SyncRedisConnectionError, asyncio.IncompleteReadError) as e:
         logger.error(f"🔁 Redis connection error, retrying in 2s: {e}")
         await asyncio.sleep(2)
@@ -0,0 +1,168 @@
+import argparse
+import datetime
+import json
+import re
+import threading
+import time
+import redis
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pathlib import Path
+from common.my_logger import logger
+from common.config import get_redis_client_v2, parquet_dir, candle_store_format
+from common.candle_store import key_prefix, read_packed_many, to_frame
+from common.expiry import Expiry
+from common.trading_hours import TradingHours
+from common.base_service import BaseService
+
+module_name = Path(__file__).stem
+
+# the HistQuote layout: one {file_initial}_{YYYYMMDD}.parquet per underlying holding the index and its options
+HIST_TIMEFRAME = 60  # HistQuote data is 1 minute bars: the candles_1m family
+SCHEMA = pa.schema([("date", pa.timestamp("ns")), ("ticker", pa.string()), ("open", pa.float64()),
+                    ("high", pa.float64()), ("low", pa.float64()), ("close", pa.float64()), ("volume", pa.int64()),
+                    ("oi", pa.int64()), ("strike", pa.string())])
+DYNAMIC = re.compile(r"d-?\d+(CE|PE)$")  # d{ix} strikes of dynamic candles, HistQuote derives its own
+
+
+def option_strike(ticker: str, exp_str_len: int):
+    return ticker[exp_str_len:-2] if ticker[-2:] in ("CE", "PE") else None
+
+
+class CandleArchiver:
+    """
+    Streams a day's live candles out of redis into the parquet files HistQuote reads, so the day stays available
+    after the candle keys expire. Keys are found with SCAN and read CHUNK at a time in one pipeline, each chunk
+    becoming a zstd row group, so memory stays at one chunk whatever the number of symbols.
+    """
+    CHUNK = 500
+
+    def __init__(self, redis_client=None, out_dir=parquet_dir, timeframe=HIST_TIMEFRAME):
+        self.packed = candle_store_format == "packed"  # json sets are the source whenever they are written
+        self.redis = redis_client or get_redis_client_v2(decode=not self.packed)
+        self.out_dir = Path(out_dir)
+        self.timeframe = timeframe
+        self.underlying = {i: Expiry(i) for i in ("NN", "SX")}
+
+    def symbols(self, date: datetime.date, expiry: Expiry):
+        """redis symbols of the index and its options (all expiries, no dynamic strikes) with candles on date"""
+        dd = expiry.get_derivative_data()
+        prefix = key_prefix(date, self.timeframe)
+        if self.packed:
+            prefix = f"p{prefix}"
+        symbols = [f'{dd["exchange"]}:{dd["underlying"]}']
+        pattern = f'{prefix}{dd["derivative_exchange"]}:{dd["derivative_name"]}[0-9]*'
+        for key in self.redis.scan_iter(pattern, count=1000):
+            key = key.decode() if isinstance(key, bytes) else key
+            if not DYNAMIC.search(key):
+                symbols.append(key[len(prefix):])
+        return symbols
+
+    def read_chunk(self, date: datetime.date, symbols):
+        """{symbol: DataFrame(date, open, high, low, close, volume, oi)} for the symbols that have candles"""
+        if self.packed:
+            frames = {symbol: to_frame(records)
+                      for symbol, records in read_packed_many(self.redis, date, symbols, self.timeframe).items()}
+            return {symbol: df for symbol, df in frames.items() if df is not None}
+        prefix = key_prefix(date, self.timeframe)
+        with self.redis.pipeline(transaction=False) as pipe:
+            for symbol in symbols:
+                pipe.zrange(f"{prefix}{symbol}", 0, -1)
+            results = pipe.execute()
+        frames = {}
+        for symbol, members in zip(symbols, results):
+            if members:
+                df = pd.DataFrame(map(json.loads, members))
+                df["date"] = pd.to_datetime(df.date)
+                frames[symbol] = df
+        return frames
+
+    def archive(self, date: datetime.date, overwrite=False):
+        """write every underlying's file for date; returns {file: rows}, files already there are kept"""
+        written = {}
+        for uix, expiry in self.underlying.items():
+            dd = expiry.get_derivative_data()
+            path = self.out_dir / f'{dd["file_initial"]}_{date:%Y%m%d}.parquet'
+            if path.exists() and not overwrite:
+                logger.info(f"{path.name} exists, not archiving {uix}")
+                continue
+            started = time.perf_counter()
+            rows = self.write_file(path, date, expiry)
+            if rows:
+                written[str(path)] = rows
+            logger.info(f"Archived {uix} {date:%Y-%m-%d}: {rows:,} candles to {path.name} "
+                        f"in {time.perf_counter() - started:.1f}s")
+        return written
+
+    def write_file(self, path: Path, date: datetime.date, expiry: Expiry):
+        symbols = self.symbols(date, expiry)
+        exp_str_len = len(expiry.get_exp_str(date))
+        tmp = path.with_suffix(".tmp")
+        rows = 0
+        writer = None
+        try:
+            for start in range(0, len(symbols), self.CHUNK):
+                frames = self.read_chunk(date, symbols[start:start + self.CHUNK])
+                if not frames:
+                    continue
+                for symbol, df in frames.items():
+                    ticker = symbol.split(":", 1)[1]  # HistQuote tickers carry no exchange
+                    df["ticker"] = ticker
+                    df["strike"] = option_strike(ticker, exp_str_len)
+                df = pd.concat(frames.values(), ignore_index=True)
+                df = df.sort_values(["ticker", "date"], kind="stable", ignore_index=True)
+                table = pa.Table.from_pandas(df[SCHEMA.names].astype({"volume": "int64", "oi": "int64"}),
+                                             schema=SCHEMA, preserve_index=False)
+                if writer is None:
+                    self.out_dir.mkdir(parents=True, exist_ok=True)
+                    writer = pq.ParquetWriter(tmp, SCHEMA, compression="zstd")
+                writer.write_table(table)
+                rows += len(df)
+        finally:
+            if writer is not None:
+                writer.close()
+        if rows:
+            tmp.replace(path)  # readers never see a half written file
+        return rows
+
+
+class CandleArchive(BaseService):
+    """archives the day's candles once the market has closed (before the 24h candle expiry)"""
+
+    def __init__(self):
+        super().__init__(module_name)
+        self.trading_hours = TradingHours(end_buffer=60)  # candle builders flush 30s after the close
+        self.archiver = CandleArchiver()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        archived = None
+        while True:
+            now = datetime.datetime.now()
+            if (not self.trading_hours.is_open() and now.time() >= self.trading_hours.end and now.weekday() < 5
+                    and not self.trading_hours.is_holiday(now) and archived != now.date()):
+                try:
+                    self.archiver.archive(now.date())
+                    archived = now.date()
+                except (redis.RedisError, OSError) as e:
+                    logger.error(f"Candle archive error: {e}")
+            time.sleep(60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="archive a day's live candles to HistQuote parquet files")
+    parser.add_argument("--date", type=datetime.date.fromisoformat, help="YYYY-MM-DD, runs as a service if omitted")
+    parser.add_argument("--overwrite", action="store_true", help="replace existing files")
+    parser.add_argument("--timeframe", type=int, default=HIST_TIMEFRAME,
+                        help="candle family in seconds, one of CANDLE_TIMEFRAMES")
+    args = parser.parse_args()
+    if args.date is None:
+        CandleArchive()
+        threading.Event().wait()
+    else:
+        print(CandleArchiver(timeframe=args.timeframe).archive(args.date, overwrite=args.overwrite))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,541 @@
+import datetime
+import pickle
+import threading
+import time
+import tracemalloc
+import numpy as np
+from common.tick_codec import parse_timestamp
+from common import clock
+
+
+class Candle:
+    """one OHLCV candle; slots keep the open and recently closed candles of the whole universe small"""
+    __slots__ = ('time', 'open', 'high', 'low', 'close', 'oi', 'volume', 'cumm_volume')
+
+    def __init__(self, time_, open_, high, low, close, oi, volume, cumm_volume):
+        self.time = time_  # bucket start, epoch seconds
+        self.open = open_
+        self.high = high
+        self.low = low
+        self.close = close
+        self.oi = oi
+        self.volume = volume
+        self.cumm_volume = cumm_volume
+
+    @property
+    def date(self):
+        return datetime.datetime.fromtimestamp(self.time)
+
+    def copy(self, time_=None):
+        return Candle(self.time if time_ is None else time_, self.open, self.high, self.low, self.close, self.oi,
+                      self.volume, self.cumm_volume)
+
+    def values(self):
+        return (self.time, self.open, self.high, self.low, self.close, self.oi, self.volume, self.cumm_volume)
+
+    def to_dict(self):
+        """the json candle as uploaded: iso date, then the fields in their historic order"""
+        return {'date': self.date.isoformat(), 'open': self.open, 'high': self.high, 'low': self.low,
+                'close': self.close, 'oi': self.oi, 'volume': self.volume, 'cumm_volume': self.cumm_volume}
+
+    def __eq__(self, other):
+        return isinstance(other, Candle) and self.values() == other.values()
+
+    def __repr__(self):
+        return f"Candle({', '.join(map(repr, self.values()))})"
+
+
+class CandleBuilder:
+    """
+    OHLCV candles for several timeframes from one pass over the ticks.
+    Ticks build the base (smallest) timeframe; a closed base candle is rolled into every higher timeframe, which
+    closes in turn when a base candle from its next bucket rolls in. Higher timeframes must be multiples of the base.
+    in_progress / completed: {timeframe: {symbol: {candle_time: Candle}}}, completed is drained by the uploader.
+
+    add_ticks takes one on_ticks batch tick by tick; add_batches takes many, flattens them into arrays and reduces
+    each run of ticks for one symbol and bucket with numpy before touching the candle dicts.
+
+    Buckets close by time: once the exchange clock (newest exchange time seen, run on by wall time while no ticks
+    arrive) is past a bucket's end plus lateness, advance() closes it even if the symbol has not ticked again.
+    Until then a symbol may hold several open buckets, so a tick that arrives out of order lands in its own bucket
+    (reordered). A tick for a closed bucket amends the uploaded candle while it is within amend_window, else it is
+    dropped. Volume is the rise in cumulative volume over the previous bucket, whatever order the ticks came in.
+    lateness=0 keeps the old behaviour of closing a bucket as soon as the symbol ticks into the next one.
+    With carry_forward, symbols without a trade get flat zero volume candles for the buckets they missed.
+    """
+
+    def __init__(self, timeframes=(3,), session_start=datetime.time(9, 15), lateness=2.0, carry_forward=False,
+                 amend_window=60):
+        self.timeframes = sorted(set(timeframes))
+        self.base = self.timeframes[0]
+        if any(tf % self.base for tf in self.timeframes):
+            raise ValueError(f"timeframes {self.timeframes} must be multiples of {self.base}")
+        self.higher = self.timeframes[1:]
+        self.session_start = session_start
+        self.session_start_sec = session_start.hour * 3600 + session_start.minute * 60 + session_start.second
+        self.in_progress = {tf: {} for tf in self.timeframes}
+        self.completed = {tf: {} for tf in self.timeframes}
+        self.lock = threading.Lock()  # guards completed, shared with the upload thread
+        self.symbols = []  # symbol id -> symbol, for the array path
+        self.symbol_ids = {}  # symbol -> id, None for symbols that get no candles
+        self.lateness = lateness
+        self.max_open = int(lateness // self.base) + 2  # open buckets per symbol (the reorder buffer)
+        self.carry_forward = carry_forward
+        self.amend_window = amend_window
+        self.amended = {tf: {} for tf in self.timeframes}  # uploaded candles changed by late ticks
+        self.recent = {tf: {} for tf in self.timeframes}  # symbol -> {candle_time: candle} closed within amend_window
+        self.last_closed = {}  # symbol -> (candle_time, close, oi, cumm_volume) of its last closed base candle
+        self.exchange_time = None  # newest exchange timestamp seen
+        self.exchange_seen_at = None  # clock.monotonic() time it was seen
+        self.watermark_closed = 0
+        self.carried_forward = 0
+        self.reordered = 0
+        self.late = 0
+        self.amended_count = 0
+        self.dropped = 0
+
+    @staticmethod
+    def wanted(symbol, tick):
+        """derivatives and indices; equities are skipped"""
+        return symbol.startswith(('NFO', 'BFO')) or not tick.get('tradable', True)
+
+    def add_ticks(self, ticks: dict, timestamp_field='exchange_timestamp'):
+        """one {symbol: tick} batch; returns the newest exchange timestamp used (0 if none)"""
+        newest_timestamp = 0
+        for symbol, symbol_tick in ticks.items():
+            if not self.wanted(symbol, symbol_tick):
+                continue
+
+            timestamp_value = symbol_tick.get(timestamp_field)
+            if not timestamp_value:
+                continue
+
+            timestamp_value = parse_timestamp(timestamp_value)
+            if timestamp_value.year <= 1970 or timestamp_value.time() <= self.session_start:
+                continue
+
+            timestamp = int(timestamp_value.timestamp())
+            newest_timestamp = max(newest_timestamp, timestamp)
+            self.update(symbol, timestamp, symbol_tick.get('last_price', None), symbol_tick.get('volume_traded', 0),
+                        symbol_tick.get('oi', 0))
+        self.observe(newest_timestamp)
+        return newest_timestamp
+
+    def observe(self, timestamp):
+        if timestamp and (self.exchange_time is None or timestamp >= self.exchange_time):
+            self.exchange_time, self.exchange_seen_at = timestamp, clock.monotonic()
+
+    def watermark(self):
+        """
+        exchange time now: the newest exchange timestamp, moved on by the time since it was seen (virtual time under
+        tick_replay, so a replay at any speed closes the same candles)
+        """
+        if self.exchange_time is None:
+            return None
+        return self.exchange_time + (clock.monotonic() - self.exchange_seen_at)
+
+    def symbol_id(self, symbol, tick):
+        if (ix := self.symbol_ids.get(symbol, -1)) != -1:
+            return ix
+        ix = None
+        if self.wanted(symbol, tick):
+            ix = len(self.symbols)
+            self.symbols.append(symbol)
+        self.symbol_ids[symbol] = ix
+        return ix
+
+    def add_batches(self, batches: list, timestamp_field='exchange_timestamp'):
+        """
+        many {symbol: tick} batches in arrival order, same result as add_ticks on each in turn.
+        Ticks are grouped into runs of one symbol and one bucket (arrival order kept within a symbol) and each run
+        is reduced to open / high / low / close / oi / max cumm_volume with numpy; only runs reach the candle dicts.
+        """
+        sym, stamps, price, volume, oi = [], [], [], [], []
+        for ticks in batches:
+            for symbol, tick in ticks.items():
+                ix = self.symbol_id(symbol, tick)
+                if ix is None:
+                    continue
+                sym.append(ix)
+                stamps.append(tick.get(timestamp_field))
+                price.append(tick.get('last_price'))
+                volume.append(tick.get('volume_traded', 0))
+                oi.append(tick.get('oi', 0))
+        if not sym:
+            return 0
+
+        # naive exchange times are local wall clock; as datetime64 they read as utc, so shift by the local offset
+        wall = np.array(stamps, dtype='datetime64[s]').astype(np.int64)
+        valid = (wall > 86400 * 365) & (wall % 86400 > self.session_start_sec)  # NaT is int64 min
+        utc_offset = int(datetime.datetime.now().astimezone().utcoffset().total_seconds())
+        sym = np.array(sym, dtype=np.int64)[valid]
+        if not len(sym):
+            return 0
+        ts = wall[valid] - utc_offset
+        price = np.array(price, dtype=np.float64)[valid]
+        volume = np.array(volume, dtype=np.float64)[valid]
+        oi = np.array(oi, dtype=np.float64)[valid]
+
+        order = np.argsort(sym, kind='stable')
+        sym, ts, price, volume, oi = sym[order], ts[order], price[order], volume[order], oi[order]
+        bucket = ts - ts % self.base
+        starts = np.flatnonzero(np.r_[True, (sym[1:] != sym[:-1]) | (bucket[1:] != bucket[:-1])])
+        ends = np.r_[starts[1:], len(sym)] - 1
+        runs = zip(sym[starts].tolist(), bucket[starts].tolist(), price[starts].tolist(),
+                   np.maximum.reduceat(price, starts).tolist(), np.minimum.reduceat(price, starts).tolist(),
+                   price[ends].tolist(), np.maximum.reduceat(volume, starts).tolist(), oi[ends].tolist())
+        symbols = self.symbols
+        for ix, candle_time, open_, high, low, close, cumm_volume, last_oi in runs:
+            self.merge(symbols[ix], candle_time, open_, high, low, close, _int(cumm_volume), _int(last_oi))
+        newest_timestamp = int(ts.max())
+        self.observe(newest_timestamp)
+        return newest_timestamp
+
+    def update(self, symbol, timestamp: int, last_price, volume_traded, oi):
+        candle_time = timestamp - (timestamp % self.base)
+        self.merge(symbol, candle_time, last_price, last_price, last_price, last_price, volume_traded, oi)
+
+    def merge(self, symbol, candle_time, open_, high, low, close, volume_traded, oi):
+        """fold a tick, or a run of ticks of one bucket, into the symbol's base candle for candle_time"""
+        last_closed = self.last_closed.get(symbol)
+        if last_closed and candle_time <= last_closed[0]:
+            self.amend(symbol, candle_time, high, low, volume_traded)
+            return
+
+        if symbol not in self.in_progress[self.base]:
+            self.in_progress[self.base][symbol] = {}
+
+        candles = self.in_progress[self.base][symbol]  # open buckets, oldest first
+        candle = candles.get(candle_time)
+
+        if candle is None:
+            candle = Candle(candle_time, open_, high, low, close, oi, 0, volume_traded)
+            if candles and candle_time < next(reversed(candles)):
+                self.reordered += 1  # older than an open bucket but still within lateness: slot it in order
+                candles[candle_time] = candle
+                ordered = sorted(candles.items())
+                candles.clear()
+                candles.update(ordered)
+            else:
+                candles[candle_time] = candle
+            # without lateness the next bucket closes the previous one, as ticks arrive
+            while len(candles) > (1 if not self.lateness else self.max_open):
+                oldest = next(iter(candles))
+                self.close(symbol, oldest, candles.pop(oldest))
+        else:
+            candle.high = max(high, candle.high)
+            candle.low = min(low, candle.low)
+            candle.close = close
+            candle.oi = oi
+            candle.cumm_volume = max(candle.cumm_volume, volume_traded)
+
+        candle.volume = max(0, candle.cumm_volume - self.baseline(symbol, candle_time))
+
+    def baseline(self, symbol, candle_time):
+        """cumulative volume at the end of the bucket before candle_time (open or closed), 0 before the first"""
+        previous = [t for t in self.in_progress[self.base].get(symbol, ()) if t < candle_time]
+        if previous:
+            return self.in_progress[self.base][symbol][previous[-1]].cumm_volume
+        last_closed = self.last_closed.get(symbol)
+        return last_closed[3] if last_closed else 0
+
+    def amend(self, symbol, candle_time, high, low, volume_traded):
+        """
+        late tick for a closed base candle: widen its high / low, raise its cumulative volume and move the volume
+        split with the following bucket, then mark it (and the higher timeframe candles holding it) for re-upload.
+        Candles older than amend_window, or buckets that never had a candle, are not amended (dropped).
+        """
+        candle = self.recent[self.base].get(symbol, {}).get(candle_time)
+        if candle is None:
+            self.dropped += 1
+            return
+        self.late += 1
+        if high <= candle.high and low >= candle.low and volume_traded <= candle.cumm_volume:
+            return  # nothing the candle does not already show
+
+        changes = {}  # candle_time -> volume change, base candles
+        old_volume = candle.volume
+        candle.high = max(high, candle.high)
+        candle.low = min(low, candle.low)
+        if volume_traded > candle.cumm_volume:
+            baseline = candle.cumm_volume - candle.volume
+            candle.cumm_volume = volume_traded
+            candle.volume = max(0, volume_traded - baseline)
+            following = self.following(symbol, candle_time)
+            if following is not None:
+                next_time, next_candle = following
+                next_old = next_candle.volume
+                next_candle.volume = max(0, next_candle.cumm_volume - volume_traded)
+                if next_candle.volume != next_old:
+                    changes[next_time] = next_candle.volume - next_old
+                    self.mark_amended(self.base, symbol, next_time, next_candle)
+            if self.last_closed[symbol][0] == candle_time:
+                self.last_closed[symbol] = self.last_closed[symbol][:3] + (volume_traded,)
+        changes[candle_time] = candle.volume - old_volume
+        self.mark_amended(self.base, symbol, candle_time, candle)
+
+        for tf in self.higher:
+            for base_time, volume_change in changes.items():
+                bucket = base_time - (base_time % tf)
+                higher = self.in_progress[tf].get(symbol, {}).get(bucket)
+                closed = higher is None
+                if closed and (higher := self.recent[tf].get(symbol, {}).get(bucket)) is None:
+                    continue
+                higher.volume += volume_change
+                if base_time == candle_time:
+                    higher.high = max(higher.high, candle.high)
+                    higher.low = min(higher.low, candle.low)
+                    higher.cumm_volume = max(higher.cumm_volume, candle.cumm_volume)
+                if closed:
+                    self.mark_amended(tf, symbol, bucket, higher)
+
+    def following(self, symbol, candle_time):
+        """(candle_time, candle) of the closed base bucket after candle_time; open buckets re-base on their own"""
+        recent = self.recent[self.base].get(symbol, {})
+        later = [t for t in recent if t > candle_time]
+        return (later[0], recent[later[0]]) if later else None
+
+    def mark_amended(self, tf, symbol, candle_time, candle):
+        with self.lock:
+            if candle_time in self.completed[tf].get(symbol, {}):
+                return  # not uploaded yet, goes out with the change
+            self.amended[tf].setdefault(symbol, {})[candle_time] = candle
+        self.amended_count += 1
+
+    def close(self, symbol, candle_time, candle):
+        """base candle is final: fill the gap before it (carry_forward), queue it for upload and roll it up"""
+        last_closed = self.last_closed.get(symbol)
+        if self.carry_forward and last_closed:
+            self.fill(symbol, candle_time - self.base)
+            last_closed = self.last_closed[symbol]
+        candle.volume = max(0, candle.cumm_volume - (last_closed[3] if last_closed else 0))
+        self.last_closed[symbol] = (candle_time, candle.close, candle.oi, candle.cumm_volume)
+        self.complete(self.base, symbol, candle_time, candle)
+        for tf in self.higher:
+            self.roll(tf, symbol, candle_time, candle)
+
+    def fill(self, symbol, until):
+        """flat zero volume candles from the symbol's last closed bucket up to until; returns how many"""
+        last_time, close, oi, cumm_volume = self.last_closed[symbol]
+        filled = 0
+        for candle_time in range(last_time + self.base, until + 1, self.base):
+            flat = Candle(candle_time, close, close, close, close, oi, 0, cumm_volume)
+            self.last_closed[symbol] = (candle_time, close, oi, cumm_volume)
+            self.complete(self.base, symbol, candle_time, flat)
+            for tf in self.higher:
+                self.roll(tf, symbol, candle_time, flat)
+            filled += 1
+        self.carried_forward += filled
+        return filled
+
+    def complete(self, tf, symbol, candle_time, candle):
+        """queue for upload and keep amend_window of closed candles for late ticks"""
+        with self.lock:
+            self.completed[tf].setdefault(symbol, {})[candle_time] = candle
+        recent = self.recent[tf].setdefault(symbol, {})
+        recent[candle_time] = candle
+        horizon = candle_time - self.amend_window
+        while (oldest := next(iter(recent))) + tf <= horizon:
+            del recent[oldest]
+
+    def roll(self, tf, symbol, candle_time, candle):
+        """merge a closed base candle into tf, closing the tf candle of the previous bucket"""
+        bucket = candle_time - (candle_time % tf)
+        current = self.in_progress[tf].setdefault(symbol, {})
+        if current and next(iter(current)) != bucket:
+            closed_time, closed_candle = current.popitem()
+            self.complete(tf, symbol, closed_time, closed_candle)
+        if not current:
+            current[bucket] = candle.copy(bucket)
+        else:
+            higher = current[bucket]
+            higher.high = max(higher.high, candle.high)
+            higher.low = min(higher.low, candle.low)
+            higher.close = candle.close
+            higher.oi = candle.oi
+            higher.volume += candle.volume
+            higher.cumm_volume = candle.cumm_volume
+
+    def advance(self, watermark=None):
+        """close every bucket that ended lateness seconds before the watermark; returns the base candles closed"""
+        watermark = self.watermark() if watermark is None else watermark
+        if watermark is None:
+            return 0
+        final_before = watermark - self.lateness
+        closed = 0
+        for symbol, candles in self.in_progress[self.base].items():
+            while candles and (candle_time := next(iter(candles))) + self.base <= final_before:
+                self.close(symbol, candle_time, candles.pop(candle_time))
+                closed += 1
+
+        if self.carry_forward:
+            last_final = int(final_before // self.base) * self.base - self.base  # start of the newest final bucket
+            for symbol in list(self.last_closed):
+                if not self.in_progress[self.base].get(symbol):  # else filled when its open candle closes
+                    closed += self.fill(symbol, last_final)
+
+        for tf in self.higher:
+            for symbol, current in self.in_progress[tf].items():
+                if current and (candle_time := next(iter(current))) + tf <= final_before:
+                    self.complete(tf, symbol, candle_time, current.pop(candle_time))
+        self.watermark_closed += closed
+        return closed
+
+    def stats(self):
+        watermark = self.watermark()
+        return {
+            "symbols": len(self.last_closed),
+            "open_candles": sum(len(c) for c in self.in_progress[self.base].values()),
+            "watermark": datetime.datetime.fromtimestamp(watermark).isoformat() if watermark else None,
+            "watermark_closed": self.watermark_closed,
+            "carried_forward": self.carried_forward,
+            "reordered": self.reordered,
+            "late": self.late,
+            "amended": self.amended_count,
+            "dropped": self.dropped,
+        }
+
+    def drain(self):
+        """
+        ({timeframe: {symbol: {candle_time: candle}}} closed since the last drain,
+         same for already uploaded candles changed by late ticks, to be replaced)
+        """
+        with self.lock:
+            drained, amended = {}, {}
+            for tf in self.timeframes:
+                if self.completed[tf]:
+                    drained[tf], self.completed[tf] = self.completed[tf], {}
+                if self.amended[tf]:
+                    amended[tf], self.amended[tf] = self.amended[tf], {}
+            return drained, amended
+
+    def checkpoint(self):
+        """
+        open candles, undrained closed candles, volume baselines and the exchange clock as bytes for restore().
+        Call from the thread that adds ticks; recent candles are left out, so late ticks for candles closed before
+        a restart are dropped rather than amended.
+        """
+        with self.lock:
+            completed = {tf: _pack_candles(self.completed[tf]) for tf in self.timeframes}
+        state = {
+            "version": 1,
+            "saved_at": clock.now().timestamp(),
+            "timeframes": self.timeframes,
+            "in_progress": {tf: _pack_candles(self.in_progress[tf]) for tf in self.timeframes},
+            "completed": completed,
+            "last_closed": self.last_closed,
+            "exchange_time": self.exchange_time,
+        }
+        return pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def restore(self, data: bytes):
+        """load a checkpoint() into an empty builder; returns the saved_at time"""
+        state = pickle.loads(data)
+        if state.get("version") != 1 or state["timeframes"] != self.timeframes:
+            raise ValueError(f"checkpoint for timeframes {state.get('timeframes')}, builder has {self.timeframes}")
+        with self.lock:
+            for tf in self.timeframes:
+                self.in_progress[tf].update(_unpack_candles(state["in_progress"][tf]))
+                self.completed[tf].update(_unpack_candles(state["completed"][tf]))
+        self.last_closed.update(state["last_closed"])
+        if state["exchange_time"] is not None:
+            # the exchange clock ran on while the process was down
+            self.exchange_time = state["exchange_time"]
+            self.exchange_seen_at = clock.monotonic() - (clock.now().timestamp() - state["saved_at"])
+        return state["saved_at"]
+
+    def reset(self):
+        with self.lock:
+            for tf in self.timeframes:
+                self.in_progress[tf].clear()
+                self.completed[tf].clear()
+                self.amended[tf].clear()
+                self.recent[tf].clear()
+        self.last_closed.clear()
+        self.exchange_time = self.exchange_seen_at = None
+
+
+def _pack_candles(symbol_candles):
+    """{symbol: {t: candle}} -> {symbol: [(time, open, high, low, close, oi, volume, cumm_volume)]}"""
+    return {symbol: [candle.values() for candle in candles.values()] for symbol, candles in symbol_candles.items()}
+
+
+def _unpack_candles(packed):
+    return {symbol: {row[0]: Candle(*row) for row in rows} for symbol, rows in packed.items()}
+
+
+def _int(value):
+    """volume / oi back from the float arrays, as the tick path would have them"""
+    return int(value) if value == value else 0
+
+
+def sample_batches(n_symbols=3000, n_batches=200, per_batch=500, start=None, seed=1):
+    """synthetic on_ticks batches: per_batch random option symbols per batch, exchange time advancing ~0.1s"""
+    rng = np.random.default_rng(seed)
+    start = start or datetime.datetime.combine(datetime.date.today(), datetime.time(10, 0))
+    symbols = [f"NFO:NIFTY25O07{24000 + 50 * i}CE" for i in range(n_symbols)]
+    prices = rng.uniform(1, 500, n_symbols)
+    volumes = np.zeros(n_symbols, dtype=np.int64)
+    batches = []
+    for b in range(n_batches):
+        now = start + datetime.timedelta(seconds=b // 10)
+        picked = rng.choice(n_symbols, per_batch, replace=False)
+        prices[picked] *= rng.normal(1, 0.001, per_batch)
+        volumes[picked] += rng.integers(0, 500, per_batch)
+        batches.append({symbols[i]: {"instrument_token": i, "tradable": True, "last_price": round(prices[i], 2),
+                                     "volume_traded": int(volumes[i]), "oi": 1000 + i, "exchange_timestamp": str(now)}
+                        for i in picked})
+    return batches
+
+
+def benchmark(n_symbols=3000, n_batches=200, per_batch=500, rounds=3):
+    """per-batch add_ticks vs add_batches over the same ticks; prints symbol-ticks/sec and checks they agree"""
+    batches = sample_batches(n_symbols, n_batches, per_batch)
+    n_ticks = sum(len(b) for b in batches)
+    results = {}
+    for name in ("add_ticks", "add_batches"):
+        best = None
+        for _ in range(rounds):
+            builder = CandleBuilder((3, 15, 60, 300, 900), session_start=datetime.time(9, 15))
+            started = time.perf_counter()
+            if name == "add_ticks":
+                for batch in batches:
+                    builder.add_ticks(batch)
+            else:
+                builder.add_batches(batches)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = builder
+        print(f"{name:12s} {n_ticks:,} ticks / {n_symbols} symbols: {best * 1000:8.1f} ms "
+              f"{n_ticks / best:12,.0f} symbol-ticks/sec")
+    same = all(results["add_ticks"].in_progress[tf] == results["add_batches"].in_progress[tf] and
+               results["add_ticks"].completed[tf] == results["add_batches"].completed[tf]
+               for tf in results["add_ticks"].timeframes)
+    print(f"identical candles: {same}")
+
+    builder = results["add_batches"]
+    builder.drain()  # as the uploader leaves it
+    packed = {tf: _pack_candles(builder.in_progress[tf]) for tf in builder.timeframes}
+    n_candles = sum(len(rows) for tf_rows in packed.values() for rows in tf_rows.values())
+    tracemalloc.start()
+    as_records = {tf: _unpack_candles(rows) for tf, rows in packed.items()}
+    records_bytes = tracemalloc.get_traced_memory()[0]
+    as_dicts = {tf: {symbol: {c.time: {**c.to_dict(), 'date': c.date} for c in candles.values()}
+                     for symbol, candles in symbol_candles.items()} for tf, symbol_candles in as_records.items()}
+    dicts_bytes = tracemalloc.get_traced_memory()[0] - records_bytes
+    tracemalloc.stop()
+    del as_records, as_dicts
+    print(f"open candles {n_candles:,}: {records_bytes / n_candles:.0f} bytes each as Candle, "
+          f"{dicts_bytes / n_candles:.0f} as dict + datetime")
+    open_candles = sum(len(c) for c in builder.in_progress[builder.base].values())
+    started = time.perf_counter()
+    data = builder.checkpoint()
+    saved = time.perf_counter()
+    CandleBuilder(builder.timeframes, session_start=builder.session_start).restore(data)
+    restored = time.perf_counter()
+    print(f"checkpoint   {len(builder.last_closed)} symbols, {open_candles} open candles: {len(data) / 1024:,.0f} KB, "
+          f"save {(saved - started) * 1000:.1f} ms, restore {(restored - saved) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    benchmark()
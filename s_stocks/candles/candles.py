@@ -4,34 +4,66 @@ import json
 import time
 import redis
 from common.my_logger import logger
-from common.config import redis_host, redis_port, redis_db
-from common_library.trading.trading_hours import TradingHours
+from common.config import redis_host, redis_port, redis_db, get_redis_client_v2, tick_transport, candle_timeframes
+from common.config import candle_batch, candle_shards, candle_shard, candle_lateness, candle_carry_forward
+from common.config import candle_amend_window, candle_store_format, candle_checkpoint_sec, candle_checkpoint_dir
+from common.tick_codec import get_tick_codec
+from common.tick_stream import TickStreamConsumer, tick_queue_key
+from common import clock
+from common.latency import LatencyRecorder, serve_metrics
+from common.candle_store import candle_key, write_packed
+from common.trading_hours import TradingHours  # honours the replay virtual clock
 from pathlib import Path
 from common.base_service import BaseService
+from candle_builder import CandleBuilder
 
 module_name = Path(__file__).stem
+service_name = module_name if candle_shards <= 1 else f"{module_name}_{candle_shard}"
+METRICS_PORT = 5022 + candle_shard  # tmp_candles' port, one per shard
 
 class Candles(BaseService):
     EXPIRY_TIME = 86400  # 1 day in seconds
 
     def __init__(self):
-        super().__init__(module_name)
-        self.timeframe = 3  # seconds
-        self.timestamp_field = 'exchange_timestamp'
-        self.in_progress_candles = {}  # Holds active candles
-        self.completed_candles = {}  # Holds candles ready to upload
-        self.lock = threading.Lock()
+        super().__init__(service_name)
         self.trading_hours = TradingHours(end_buffer=30)
+        # 3s candles rolled up into the higher timeframes
+        self.builder = CandleBuilder(candle_timeframes, session_start=self.trading_hours.start,
+                                     lateness=candle_lateness, carry_forward=candle_carry_forward,
+                                     amend_window=candle_amend_window)
+        self.last_advance = 0.0
+        self.timeframe = self.builder.base  # seconds
+        self.timestamp_field = 'exchange_timestamp'
+        self.in_progress_candles = self.builder.in_progress  # Holds active candles, per timeframe
+        self.completed_candles = self.builder.completed  # Holds candles ready to upload, per timeframe
+        self.batch_size = candle_batch
+        self.latency = LatencyRecorder(service_name)
+        self.ticks_key = tick_queue_key(candle_shard)  # this shard's symbols only when CANDLE_SHARDS > 1
+        self.newest_timestamp = None  # newest exchange time built, for shard lag
+        self.checkpoint_key = f"candle_state:{service_name}"
+        self.checkpoint_path = Path(candle_checkpoint_dir) / f"{service_name}.pkl" if candle_checkpoint_dir else None
+        self.last_checkpoint = clock.monotonic()
+        self.checkpoint_info = {"saves": 0, "bytes": 0, "save_ms": 0.0, "restored_symbols": 0, "restore_ms": None}
 
         self.redis = redis.Redis(host=redis_host, port=redis_port, db=redis_db, decode_responses=True)
         self.pipe = self.redis.pipeline()
+        self.codec = get_tick_codec()
+        self.tick_redis = get_redis_client_v2(decode=not self.codec.binary)
+        self.state_redis = get_redis_client_v2(decode=False)
+        self.restore_checkpoint()
+        self.tick_consumer = None
+        if tick_transport == "stream":
+            self.tick_consumer = TickStreamConsumer(self.tick_redis, group=module_name, count=max(self.batch_size, 1),
+                                                    stream=self.ticks_key)
+        self.latency.start_publisher(self.redis)
+        threading.Thread(target=self.publish_shard_stats, daemon=True).start()
         threading.Thread(target=self.upload_candle, daemon=True).start()
         threading.Thread(target=self.build_candles, daemon=True).start()
 
     def check_market_status(self, log_message=True):
         if not self.trading_hours.is_open():
             wait_time = self.trading_hours.time_until_next_open().total_seconds()
-            next_open_time = datetime.datetime.now() + datetime.timedelta(seconds=wait_time)
+            next_open_time = clock.now() + datetime.timedelta(seconds=wait_time)
             if log_message:
                 logger.info(
                     f"Resetting candles and suspending till {next_open_time:%d-%b-%Y %H:%M} | {wait_time:.0f}sec")
@@ -41,108 +73,205 @@ class Candles(BaseService):
                 logger.info(f"Candles resuming...")
 
     def build_candles(self):
+        if self.tick_consumer:
+            return self.build_candles_from_stream()
+        while True:
+            self.check_market_status()
+            if self.batch_size > 1:
+                # whatever is queued in one round trip, else block for the next message
+                payloads = self.tick_redis.rpop(self.ticks_key, self.batch_size)
+                if not payloads and (tick := self.tick_redis.brpop([self.ticks_key], timeout=1)) is not None:
+                    payloads = [tick[1]]
+                if payloads:
+                    self.process_batches([self.codec.decode_batch(p) for p in payloads])
+            else:
+                tick = self.tick_redis.brpop([self.ticks_key], timeout=1)
+                if tick is not None:
+                    self.process_tick(self.codec.decode_batch(tick[1]))
+            self.advance()
+
+    def build_candles_from_stream(self):
         while True:
             self.check_market_status()
-            tick = self.redis.brpop(["ticks"], timeout=10)
-            if tick is not None:
-                self.process_tick(json.loads(tick[1]))
+            try:
+                entries = self.tick_consumer.read()
+                batches = [self.codec.decode_batch(payload) for _, payload in entries if payload is not None]
+                if self.batch_size > 1:
+                    self.process_batches(batches)
+                else:
+                    for batch in batches:
+                        self.process_tick(batch)
+                self.tick_consumer.ack([entry_id for entry_id, _ in entries])
+                self.advance()
+            except redis.RedisError as e:
+                logger.error(f"Tick stream read failed: {e}")
+                time.sleep(1)
 
     def process_tick(self, tick):
-        for symbol, symbol_tick in tick.items():
+        newest_timestamp = self.builder.add_ticks(tick, self.timestamp_field)
+        if newest_timestamp:
+            self.newest_timestamp = max(self.newest_timestamp or 0, newest_timestamp)
+            self.latency.record_since("exchange_to_candle_input", newest_timestamp)
 
-            if not symbol.startswith(('NFO', 'BFO')) and symbol_tick.get('tradable', True):
-                continue
+    def process_batches(self, batches):
+        """several tick messages at once through the vectorised path"""
+        newest_timestamp = self.builder.add_batches(batches, self.timestamp_field) if batches else 0
+        if newest_timestamp:
+            self.newest_timestamp = max(self.newest_timestamp or 0, newest_timestamp)
+            self.latency.record_since("exchange_to_candle_input", newest_timestamp)
 
-            timestamp_value = symbol_tick.get(self.timestamp_field)
-            if not timestamp_value:
-                continue
+    def advance(self, interval=1.0):
+        """
+        watermark close, at most once per interval of clock time (virtual under replay); runs on the build thread,
+        which owns in-progress state
+        """
+        if clock.monotonic() - self.last_advance >= interval:
+            self.last_advance = clock.monotonic()
+            self.builder.advance()
+        if candle_checkpoint_sec and clock.monotonic() - self.last_checkpoint >= candle_checkpoint_sec:
+            self.last_checkpoint = clock.monotonic()
+            self.save_checkpoint()
 
-            timestamp_value = datetime.datetime.fromisoformat(timestamp_value)
-            if timestamp_value.year <= 1970 or timestamp_value.time() <= self.trading_hours.start:
-                continue
+    def save_checkpoint(self):
+        """builder state for a restart mid-session; on the build thread, which owns in-progress state"""
+        started = time.perf_counter()
+        data = self.builder.checkpoint()
+        try:
+            if self.checkpoint_path:
+                tmp = self.checkpoint_path.with_suffix(".tmp")
+                tmp.write_bytes(data)
+                tmp.replace(self.checkpoint_path)
+            else:
+                self.state_redis.set(self.checkpoint_key, data, ex=self.EXPIRY_TIME)
+        except (redis.RedisError, OSError) as e:
+            logger.error(f"Candle checkpoint failed: {e}")
+            return
+        self.checkpoint_info.update(saves=self.checkpoint_info["saves"] + 1, bytes=len(data),
+                                    save_ms=round((time.perf_counter() - started) * 1000, 1))
 
-            timestamp = int(timestamp_value.timestamp())
-            candle_time = timestamp - (timestamp % self.timeframe)
-            last_price = symbol_tick.get('last_price', None)
-            current_volume_traded = symbol_tick.get('volume_traded', 0)
-            new_candle = False
+    def load_checkpoint(self):
+        if self.checkpoint_path:
+            return self.checkpoint_path.read_bytes() if self.checkpoint_path.exists() else None
+        return self.state_redis.get(self.checkpoint_key)
 
-            if symbol not in self.in_progress_candles:
-                self.in_progress_candles[symbol] = {}
+    def restore_checkpoint(self):
+        """pick up open candles and volume baselines saved earlier in this session, else start empty"""
+        if not candle_checkpoint_sec or not self.trading_hours.is_open():
+            return
+        started = time.perf_counter()
+        try:
+            data = self.load_checkpoint()
+            if not data:
+                return
+            saved_at = self.builder.restore(data)
+        except (redis.RedisError, OSError, ValueError) as e:
+            logger.error(f"Candle checkpoint not restored: {e}")
+            self.builder.reset()
+            return
+        if datetime.datetime.fromtimestamp(saved_at).date() != clock.now().date():
+            self.builder.reset()  # yesterday's session
+            return
+        self.newest_timestamp = self.builder.exchange_time
+        self.checkpoint_info.update(restored_symbols=len(self.builder.last_closed),
+                                    restore_ms=round((time.perf_counter() - started) * 1000, 1))
+        logger.info(f"Restored {len(self.builder.last_closed)} symbols from a checkpoint "
+                    f"{clock.now().timestamp() - saved_at:.0f}s old in {self.checkpoint_info['restore_ms']}ms")
 
-            candle = self.in_progress_candles[symbol]
+    def drop_checkpoint(self):
+        try:
+            if self.checkpoint_path:
+                self.checkpoint_path.unlink(missing_ok=True)
+            else:
+                self.state_redis.delete(self.checkpoint_key)
+        except (redis.RedisError, OSError) as e:
+            logger.error(f"Candle checkpoint not dropped: {e}")
 
-            if candle:
-                prv_candle_time = next(iter(candle))
-                if prv_candle_time != candle_time:
-                    prv_candle = candle.pop(prv_candle_time, {})
-                    prv_cumm_volume = prv_candle['cumm_volume']
-                    candle.clear()
-                    new_candle = True
+    def metrics(self):
+        return {**self.latency.snapshot(), "shard": self.shard_stats(), "builder": self.builder.stats(),
+                "checkpoint": self.checkpoint_info}
 
-                    with self.lock:
-                        self.completed_candles.setdefault(symbol, {})[prv_candle_time] = prv_candle.copy()
-                    # threading.Event().wait(0.1)
-                else:
-                    prv_cumm_volume = candle[candle_time]['cumm_volume'] - candle[candle_time]['volume']
-            else:
-                new_candle = True
-                prv_cumm_volume = 0
-
-            if new_candle:
-                candle[candle_time] = {
-                    'date': datetime.datetime.fromtimestamp(candle_time),
-                    'open': last_price,
-                    'high': last_price,
-                    'low': last_price,
-                }
-
-            candle[candle_time].update({
-                'high': max(last_price, candle[candle_time]['high']),
-                'low': min(last_price, candle[candle_time]['low']),
-                'close': last_price,
-                'oi': symbol_tick.get('oi', 0),
-                'volume': max(0, current_volume_traded - prv_cumm_volume),
-                'cumm_volume': current_volume_traded,
-            })
+    def shard_stats(self):
+        """queue backlog and how far this builder trails exchange time, to size CANDLE_SHARDS against cores"""
+        if self.tick_consumer:
+            depth = self.tick_consumer.lag()
+        else:
+            depth = self.tick_redis.llen(self.ticks_key)
+        lag = time.time() - self.newest_timestamp if self.newest_timestamp else None
+        return {
+            "shard": candle_shard,
+            "shards": candle_shards,
+            "ticks_key": self.ticks_key,
+            "queue_depth": depth,
+            "lag_sec": round(lag, 2) if lag is not None else None,
+        }
+
+    def publish_shard_stats(self, interval=5):
+        while True:
+            time.sleep(interval)
+            if not self.trading_hours.is_open():
+                continue
+            try:
+                self.redis.publish("telemetry_channel", json.dumps({"source": service_name, **self.shard_stats()}))
+            except redis.RedisError as e:
+                logger.error(f"Redis telemetry error: {e}")
 
     def reset(self):
-        with self.lock:
-            self.in_progress_candles.clear()
-            self.completed_candles.clear()
+        self.builder.reset()
+        self.newest_timestamp = None
+        self.drop_checkpoint()  # the session is over, nothing to resume
+
+    def store_candle(self, pipe, timeframe, symbol, candle_time, candle, replace=False):
+        """queue the candle in the CANDLE_STORE format(s); replace drops the json member already scored at
+        candle_time (packed appends the amended record, readers keep the last). Returns the candle's iso date."""
+        value = candle.to_dict()
+        if candle_store_format in ("json", "both"):
+            key = candle_key(candle_time, symbol, timeframe)
+            if replace:
+                pipe.zremrangebyscore(key, candle_time, candle_time)
+            pipe.zadd(key, {json.dumps(value): candle_time})
+            pipe.expire(key, self.EXPIRY_TIME)
+        if candle_store_format in ("packed", "both"):
+            if key := write_packed(pipe, candle_time, symbol, value, timeframe):
+                pipe.expire(key, self.EXPIRY_TIME)
+        return value["date"]
 
     def upload_candle(self):
         while True:
             self.check_market_status(log_message=False)
             time.sleep(self.timeframe)
 
-            with self.lock:
-                to_upload = {symbol: self.completed_candles.pop(symbol, {}) for symbol in list(self.completed_candles)}
+            to_upload, amended = self.builder.drain()  # {timeframe: {symbol: {candle_time: candle}}}
 
-            if not to_upload:
+            if not to_upload and not amended:
                 continue
 
             try:
                 list_key = 'underlying_candles'
                 with self.redis.pipeline() as pipe:
-                    for symbol, candles in to_upload.items():
-                        for candle_time, candle in candles.items():
-                            key = f"candles{datetime.datetime.fromtimestamp(candle_time).strftime('%Y%m%d')}:{symbol}"
-                            candle["date"] = candle["date"].isoformat()
-                            value = json.dumps(candle)
-                            pipe.zadd(key, {value: candle_time})
-                            pipe.expire(key, self.EXPIRY_TIME)
-                            if symbol in ("NSE:NIFTY 50", "BSE:SENSEX"):
-                                list_value = {"symbol": symbol, "date": candle['date'], 'close': candle['close']}
-                                list_value = json.dumps(list_value)
-                                pipe.lpush(list_key, list_value)
+                    for timeframe, symbol_candles in to_upload.items():
+                        for symbol, candles in symbol_candles.items():
+                            for candle_time, candle in candles.items():
+                                date_iso = self.store_candle(pipe, timeframe, symbol, candle_time, candle)
+                                if timeframe == self.timeframe and symbol in ("NSE:NIFTY 50", "BSE:SENSEX"):
+                                    list_value = {"symbol": symbol, "date": date_iso, 'close': candle.close}
+                                    list_value = json.dumps(list_value)
+                                    pipe.lpush(list_key, list_value)
+
+                    # late ticks changed these after upload
+                    for timeframe, symbol_candles in amended.items():
+                        for symbol, candles in symbol_candles.items():
+                            for candle_time, candle in candles.items():
+                                self.store_candle(pipe, timeframe, symbol, candle_time, candle, replace=True)
 
                     pipe.expire(list_key, 24 * 60 * 60)
                     pipe.execute()
+                for candle_time in {t for candles in to_upload.get(self.timeframe, {}).values() for t in candles}:
+                    self.latency.record_since("candle_close_to_upload", candle_time + self.timeframe)
             except redis.RedisError as e:
                 logger.error(f"Redis pipeline execution failed: {e}")
 
 
 if __name__ == '__main__':
     _candles = Candles()
+    serve_metrics(METRICS_PORT, _candles.metrics)
     threading.Event().wait()
@@ -3,6 +3,7 @@ from common.config import server_url
 from common.utils import list_routes, register_service
 from pathlib import Path
 from candles import Candles
+from candle_builder import Candle
 
 app = Flask(__name__, template_folder=".", static_folder=".")
 app.config['TEMPLATES_AUTO_RELOAD'] = True
@@ -19,12 +20,17 @@ def hello():
 
 @app.route('/open')
 def open():
-    return json.dumps(candles.in_progress_candles, default=lambda x: x.isoformat())
+    return json.dumps(candles.in_progress_candles, default=Candle.to_dict)
 
 
 @app.route('/closed')
 def closed():
-    return json.dumps(candles.completed_candles, default=lambda x: x.isoformat())
+    return json.dumps(candles.completed_candles, default=Candle.to_dict)
+
+
+@app.route('/metrics')
+def metrics():
+    return jsonify(candles.metrics())
 
 
 @app.route("/routes", methods=["GET"])
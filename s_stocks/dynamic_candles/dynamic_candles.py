@@ -1,26 +1,83 @@
 import redis
 from common.expiry import Expiry
+from common import clock
+from common.latency import LatencyRecorder, serve_metrics
 from common.my_logger import logger
-from common.config import redis_host, redis_port, redis_db
+from common.config import redis_host, redis_port, redis_db, candle_store_format
 import json
-from common_library.trading.trading_hours import TradingHours
+from common.trading_hours import TradingHours  # honours the replay virtual clock
 import datetime
 from apscheduler.schedulers.blocking import BlockingScheduler
+import random
 import signal
+import sys
+import threading
+import time
 from pathlib import Path
 from common.base_service import BaseService
 
 module_name = Path(__file__).stem
+METRICS_PORT = 5023  # tmp_dynamic_candles' port
+UNDERLYING_CANDLES = "underlying_candles"
+STRIKE_IXS = range(-1, 26)  # ITM (-1) to OTM (25)
+BENCHMARK_DB = 15  # scratch redis db for benchmark(), never the live one
+
+# KEYS: the option candle keys to read, then as many d{ix}{PE|CE} keys to write (generate_option_symbols order).
+# ARGV: candle start, iso date, ttl, then the strike of each option key. Same result as the client path: latest
+# option candle at or before the start, re-dated and given its strike. The json written by the candle builder starts
+# with the date, so that is swapped in the string and only other payloads go through cjson.
+RESOLVE_SCRIPT = """
+local ts, date_iso, ttl = ARGV[1], ARGV[2], tonumber(ARGV[3])
+local date_field = '{"date": "' .. date_iso .. '"'
+local n = #KEYS / 2
+local written = 0
+for i = 1, n do
+    local found = redis.call('zrevrangebyscore', KEYS[i], ts, '-inf', 'LIMIT', 0, 1)[1]
+    if found then
+        local strike = ARGV[3 + i]
+        local data, count = string.gsub(found, '^{"date": "[^"]*"', date_field, 1)
+        if count == 1 then
+            data = string.sub(data, 1, -2) .. ', "strike": ' .. strike .. '}'
+        else
+            local candle = cjson.decode(found)
+            candle['date'] = date_iso
+            candle['strike'] = tonumber(strike)
+            data = cjson.encode(candle)
+        end
+        redis.call('zadd', KEYS[n + i], ts, data)
+        redis.call('expire', KEYS[n + i], ttl)
+        written = written + 1
+    end
+end
+return written
+"""
 
 class DynamicCandlesBuilder(BaseService):
+    """
+    d{ix}{PE/CE} candles: for every underlying candle, the option candles at fixed strike offsets from its ATM.
+    Blocks on underlying_candles and takes everything queued per wake-up, so a backlog is cleared in one pass:
+    one pipeline reads the option candles for all of them and one writes the dynamic candles.
+    """
+    MAX_DRAIN = 1000  # underlying candles per wake-up
 
     def __init__(self):
+        if candle_store_format == "packed":
+            # the option candles are read from the json sets (RESOLVE_SCRIPT too), packed alone leaves them empty
+            raise SystemExit("dynamic candles need the json candle sets: CANDLE_STORE=packed, set json or both")
         super().__init__(module_name)
         self.redis = redis.Redis(host=redis_host, port=redis_port, db=redis_db, decode_responses=True)
         self.pipe = self.redis.pipeline()
+        self.resolve_script = self.redis.register_script(RESOLVE_SCRIPT)
         self.trading_hours = TradingHours(end_buffer=30)
+        self.latency = LatencyRecorder(module_name)
+        self.latency.start_publisher(self.redis)
         self.underlying_map = {"NSE:NIFTY 50": "NN", "BSE:SENSEX": "SX"}
         self.expiry = {k: Expiry(v) for k, v in self.underlying_map.items()}
+        self.stop_event = threading.Event()
+        self.wakeups = 0
+        self.processed = 0
+        self.max_drain = 0
+        self.last_lag = None  # seconds from the newest underlying candle's close to its dynamic candles
         self.scheduler = BlockingScheduler()
         self.schedule_tasks()
         signal.signal(signal.SIGINT, self.graceful_exit)  # Ctrl+C
@@ -30,46 +87,111 @@ class DynamicCandlesBuilder(BaseService):
         if self.trading_hours.is_open():
             market_close_time = self.trading_hours.get_market_close_time()
             logger.info(f"Starting dynamic candles scheduler until {market_close_time}")
-            self.scheduler.add_job(self.build, "interval", seconds=1, id="dynamic_candles", end_date=market_close_time)
+            self.scheduler.add_job(self.run, "date", id="dynamic_candles", args=[market_close_time],
+                                   replace_existing=True)
             # NEW: Schedule `schedule_tasks()` to run immediately after market close
             self.scheduler.add_job(self.schedule_tasks, "date",
                                    run_date=market_close_time + datetime.timedelta(seconds=5),
                                    id="post_market_reset")
         else:
-            next_open_time = datetime.datetime.now() + self.trading_hours.time_until_next_open()
+            next_open_time = clock.now() + self.trading_hours.time_until_next_open()
             logger.info(f"Rescheduling dynamic candles till {next_open_time:%d-%b-%Y %H:%M}")
             self.reset()
             self.scheduler.add_job(self.schedule_tasks, "date", run_date=next_open_time, id="reschedule_job")
 
     def graceful_exit(self, signum=None, frame=None):
-        self.scheduler.shutdown()
+        self.stop_event.set()
+        self.scheduler.shutdown(wait=False)
         exit(0)
 
-    def build(self):
-        underlying_candle = self.redis.rpop("underlying_candles")
-        if underlying_candle is not None:
-            self.process_underlying_candle(json.loads(underlying_candle))
+    def run(self, until):
+        """block on underlying candles until the market closes"""
+        while not self.stop_event.is_set() and clock.now() < until:
+            try:
+                self.build()
+            except redis.RedisError as e:
+                logger.error(f"Dynamic candles redis error: {e}")
+                self.stop_event.wait(1)
+
+    def build(self, timeout=1):
+        """wait up to timeout for an underlying candle, then process it with everything queued behind it"""
+        item = self.redis.brpop([UNDERLYING_CANDLES], timeout=timeout)
+        if item is None:
+            return 0
+        payloads = [item[1]] + (self.redis.rpop(UNDERLYING_CANDLES, self.MAX_DRAIN - 1) or [])  # oldest first
+        candles = [json.loads(payload) for payload in payloads]
+        self.process_underlying_candles(candles)
+        for candle in candles:
+            # underlying candle closes 3s after its start
+            self.last_lag = time.time() - (datetime.datetime.fromisoformat(candle["date"]).timestamp() + 3)
+            self.latency.record("underlying_candle_to_dynamic", self.last_lag)
+        self.wakeups += 1
+        self.processed += len(payloads)
+        self.max_drain = max(self.max_drain, len(payloads))
+        return len(payloads)
 
     def reset(self):
-        self.redis.delete("underlying_candles")
+        self.redis.delete(UNDERLYING_CANDLES)
 
     def process_underlying_candle(self, candle):
-        underlying, date_iso, close = candle["symbol"], candle["date"], candle["close"]
-        date = datetime.datetime.fromisoformat(date_iso)
-        option_symbols, key_prefix = self.generate_option_symbols(date=date, underlying=underlying, close=close)
-        matching_candles = (self.fetch_matching_candles(option_symbols, date))
-        self.store_dynamic_candles(date_iso=date_iso, matching_candles=matching_candles, key_prefix=key_prefix)
+        self.process_underlying_candles([candle])
 
-    def generate_option_symbols(self, date, underlying, close):
-        strike_width = self.expiry[underlying].get_strike_width()
+    def process_underlying_candles(self, candles, server_side=True):
+        """
+        dynamic candles for each underlying candle. server_side: one pipelined RESOLVE_SCRIPT call per candle, a
+        single round trip in all; else the client path, one round trip to read the option candles, one to store.
+        """
+        if not server_side:
+            return self.process_client_side(candles)
+        for candle in candles:
+            date = datetime.datetime.fromisoformat(candle["date"])
+            option_symbols, key_prefix = self.generate_option_symbols(date=date, underlying=candle["symbol"],
+                                                                      close=candle["close"])
+            keys = ([symbol for _, __, symbol in option_symbols] +
+                    [f"{key_prefix}{strike_ix}" for strike_ix, _, __ in option_symbols])
+            args = [int(date.timestamp()), candle["date"], 24 * 60 * 60] + [strike for _, strike, __ in option_symbols]
+            self.resolve_script(keys=keys, args=args, client=self.pipe)
+        self.pipe.execute()
+
+    def process_client_side(self, candles):
+        resolved = []
+        for candle in candles:
+            date = datetime.datetime.fromisoformat(candle["date"])
+            option_symbols, key_prefix = self.generate_option_symbols(date=date, underlying=candle["symbol"],
+                                                                      close=candle["close"])
+            resolved.append((candle["date"], option_symbols, key_prefix))
+            self.queue_matching_candles(option_symbols, date)
+        results = iter(self.pipe.execute())
+        for date_iso, option_symbols, key_prefix in resolved:
+            matching_candles = self.matching_candles(option_symbols, results)
+            self.store_dynamic_candles(date_iso=date_iso, matching_candles=matching_candles, key_prefix=key_prefix)
+        self.pipe.execute()
+
+    def metrics(self):
+        return {**self.latency.snapshot(), "queue": self.stats()}
+
+    def stats(self):
+        return {
+            "queue_depth": self.redis.llen(UNDERLYING_CANDLES),
+            "lag_ms": round(self.last_lag * 1000, 1) if self.last_lag is not None else None,
+            "wakeups": self.wakeups,
+            "processed": self.processed,
+            "max_drain": self.max_drain,
+        }
+
+    def key_prefix(self, date, underlying):
         derivative_exchange = self.expiry[underlying].get_derivative_exchange()
         expiry_str = self.expiry[underlying].get_exp_str(date.date())
-        key_prefix = f"candles{date:%Y%m%d}:{derivative_exchange}:{expiry_str}"
+        return f"candles{date:%Y%m%d}:{derivative_exchange}:{expiry_str}"
+
+    def generate_option_symbols(self, date, underlying, close):
+        strike_width = self.expiry[underlying].get_strike_width()
+        key_prefix = self.key_prefix(date, underlying)
 
         atm_price = int(round(close / strike_width) * strike_width)
         option_symbols = []
         for opt_type in ["PE", "CE"]:
-            for strike_ix in range(-1, 26):  # ITM (-1) to OTM (25)
+            for strike_ix in STRIKE_IXS:
                 strike = atm_price + (strike_ix * strike_width * {"PE": -1, "CE": 1}[opt_type])
                 option_symbols.append(
                     (f"d{strike_ix}{opt_type}", strike,
@@ -77,11 +199,14 @@ class DynamicCandlesBuilder(BaseService):
 
         return option_symbols, key_prefix
 
-    def fetch_matching_candles(self, option_symbols, date):
+    def queue_matching_candles(self, option_symbols, date):
         timestamp = date.timestamp()
         for _, __, symbol in option_symbols:
             self.pipe.zrevrangebyscore(symbol, timestamp, "-inf", start=0, num=1)
-        results = self.pipe.execute()
+
+    @staticmethod
+    def matching_candles(option_symbols, results):
+        """{strike_ix: (strike, latest option candle json or None)}, consuming one result per option symbol"""
         return {strike_ix: (strike, data[0] if data else None) for (strike_ix, strike, symbol), data in
                 zip(option_symbols, results)}
 
@@ -97,9 +222,65 @@ class DynamicCandlesBuilder(BaseService):
                 timestamp = int(datetime.datetime.fromisoformat(date_iso).timestamp())
                 self.pipe.zadd(key, {data: timestamp})  # Store with timestamp
                 self.pipe.expire(key, 24 * 60 * 60)
-        self.pipe.execute()
+
+    def benchmark(self, n_candles=300, underlying="NSE:NIFTY 50", db=BENCHMARK_DB):
+        """
+        per underlying candle latency of the client path against RESOLVE_SCRIPT, and whether both store the same
+        dynamic candles. Runs on its own redis db, which must be empty and is flushed afterwards.
+        """
+        bench = redis.Redis(host=redis_host, port=redis_port, db=db, decode_responses=True)
+        if db == redis_db or bench.dbsize():
+            raise SystemExit(f"benchmark needs an empty redis db other than the live db {redis_db}, db {db} is not")
+        live = self.redis, self.pipe, self.resolve_script
+        self.redis, self.pipe, self.resolve_script = bench, bench.pipeline(), bench.register_script(RESOLVE_SCRIPT)
+        try:
+            self.run_benchmark(n_candles, underlying)
+        finally:
+            bench.flushdb()
+            self.redis, self.pipe, self.resolve_script = live
+
+    def run_benchmark(self, n_candles, underlying):
+        rng = random.Random(1)
+        start = datetime.datetime.combine(clock.now().date(), datetime.time(10))
+        width = self.expiry[underlying].get_strike_width()
+        prefix = self.key_prefix(start, underlying)
+        closes = [25000 + rng.uniform(-1, 1) * 10 * width for _ in range(n_candles)]
+        strikes = range(int(min(closes) // width - 30) * width, int(max(closes) // width + 31) * width, width)
+        candles = []
+        with self.redis.pipeline() as pipe:
+            for k, close in enumerate(closes):
+                date = start + datetime.timedelta(seconds=3 * k)
+                for strike in strikes:
+                    for opt_type in ("PE", "CE"):
+                        option = {"date": date.isoformat(), "open": 100.5, "high": 101.25, "low": 99.75,
+                                  "close": rng.uniform(1, 500), "oi": 1000, "volume": k, "cumm_volume": k * k}
+                        pipe.zadd(f"{prefix}{strike}{opt_type}", {json.dumps(option): date.timestamp()})
+                candles.append({"symbol": underlying, "date": date.isoformat(), "close": close})
+            pipe.execute()
+
+        def dynamic_keys():
+            return [f"{prefix}d{ix}{opt_type}" for ix in STRIKE_IXS for opt_type in ("PE", "CE")]
+
+        results = {}
+        for server_side in (False, True):
+            self.redis.delete(*dynamic_keys())
+            elapsed = []
+            for candle in candles:
+                started = time.perf_counter()
+                self.process_underlying_candles([candle], server_side=server_side)
+                elapsed.append((time.perf_counter() - started) * 1000)
+            elapsed.sort()
+            results[server_side] = {key: self.redis.zrange(key, 0, -1, withscores=True) for key in dynamic_keys()}
+            print(f"{'lua script' if server_side else 'client':10s} {n_candles} candles: "
+                  f"median {elapsed[len(elapsed) // 2]:.2f} ms, p95 {elapsed[int(len(elapsed) * 0.95)]:.2f} ms "
+                  f"per underlying candle")
+        print(f"identical dynamic candles: {results[False] == results[True]}")
 
 
 if __name__ == '__main__':
     dc = DynamicCandlesBuilder()
-    dc.scheduler.start()
+    if sys.argv[1:2] == ["benchmark"]:
+        dc.benchmark(db=int(sys.argv[2]) if sys.argv[2:] else BENCHMARK_DB)  # python dynamic_candles.py benchmark [db]
+    else:
+        serve_metrics(METRICS_PORT, dc.metrics)
+        dc.scheduler.start()
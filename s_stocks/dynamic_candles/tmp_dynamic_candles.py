@@ -14,6 +14,11 @@ port = 5023
 dynamic_candles = DynamicCandlesBuilder()
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return jsonify(dynamic_candles.metrics())
+
+
 @app.route("/routes", methods=["GET"])
 def get_routes():
     return list_routes(app)
@@ -2,7 +2,8 @@ import pandas as pd
 import datetime as dt
 from common.expiry import Expiry
 import redis
-from common.config import redis_host, redis_port, redis_db
+from common.config import redis_host, redis_port, redis_db, candle_store_format
+from common.candle_store import candle_key, read_packed, to_frame, BASE_TIMEFRAME
 import json
 from common.my_logger import logger
 
@@ -11,20 +12,24 @@ class LiveQuote:
     def __init__(self):
         self.date = dt.date.today()
         self.redis = redis.Redis(host=redis_host, port=redis_port, db=redis_db, decode_responses=True)
+        self.packed = candle_store_format in ("packed", "both")
+        self.redis_raw = redis.Redis(host=redis_host, port=redis_port, db=redis_db) if self.packed else None
         self.underlying = {i: Expiry(i) for i in ("NN", "SX")}
 
     def set_date(self, date):
         ... # dummy for consistency with hist_quote (in spread)
 
-    def quote(self, uix, opt_type=None, strike=None, **kwargs):
-        date_str = self.date.strftime('%Y%m%d')
+    def quote(self, uix, opt_type=None, strike=None, timeframe=BASE_TIMEFRAME, **kwargs):
+        """timeframe: any of the candle builder's CANDLE_TIMEFRAMES (seconds)"""
         dd = self.underlying[uix].get_derivative_data()
         exp = self.underlying[uix]
         if opt_type is None:
-            redis_key = f'candles{date_str}:{dd["exchange"]}:{dd["underlying"]}'
+            symbol = f'{dd["exchange"]}:{dd["underlying"]}'
         else:
-            redis_key = f'candles{date_str}:{dd["derivative_exchange"]}:{exp.get_exp_str(self.date)}{strike}{opt_type}'
-        redis_data: list = self.redis.zrange(redis_key, 0, -1)
+            symbol = f'{dd["derivative_exchange"]}:{exp.get_exp_str(self.date)}{strike}{opt_type}'
+        if self.packed and not str(strike).startswith("d"):  # d{ix} strikes are dynamic candles, json only
+            return to_frame(read_packed(self.redis_raw, self.date, symbol, timeframe))
+        redis_data: list = self.redis.zrange(candle_key(self.date, symbol, timeframe), 0, -1)
         if redis_data:
             df = pd.DataFrame(map(json.loads, redis_data))
             df['date'] = pd.to_datetime(df.date)
@@ -0,0 +1,77 @@
+import datetime
+import threading
+import time
+import redis
+from pathlib import Path
+from common.my_logger import logger
+from common.config import get_redis_client_v2
+from common.tick_codec import get_tick_codec
+from common.tick_segment import SegmentWriter, compact_day
+from common_library.trading.trading_hours import TradingHours
+from common.base_service import BaseService
+
+module_name = Path(__file__).stem
+
+
+class TickRecorder(BaseService):
+    """Records every tick_channel batch to day segment files, compacted to parquet at market close"""
+
+    def __init__(self):
+        super().__init__(module_name)
+        self.codec = get_tick_codec()
+        self.redis = get_redis_client_v2(decode=not self.codec.binary)
+        self.trading_hours = TradingHours(end_buffer=30)
+        self.writer = None
+        self.bad_messages = 0
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        while True:
+            if not self.trading_hours.is_open():
+                wait_time = self.trading_hours.time_until_next_open().total_seconds()
+                next_open_time = datetime.datetime.now() + datetime.timedelta(seconds=wait_time)
+                logger.info(f"Tick recorder suspended till {next_open_time:%d-%b-%Y %H:%M} | {wait_time:.0f}sec")
+                time.sleep(wait_time)
+                continue
+            try:
+                self.record_session()
+            except redis.RedisError as e:
+                logger.error(f"Tick recorder redis error: {e}")
+                time.sleep(1)
+            finally:
+                self.close_segment()
+
+    def record_session(self):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe("tick_channel")
+        self.writer = SegmentWriter(datetime.date.today())
+        logger.info(f"Recording ticks to {self.writer.path}")
+        try:
+            while self.trading_hours.is_open():
+                msg = pubsub.get_message(timeout=1)
+                if msg is None:
+                    continue
+                try:
+                    ticks = self.codec.decode_batch(msg["data"])
+                except Exception as e:  # json / msgpack / struct each raise their own errors on a bad payload
+                    self.bad_messages += 1
+                    logger.error(f"Tick recorder skipped an undecodable message ({self.bad_messages} so far): {e}")
+                    continue
+                self.writer.write(ticks)
+        finally:
+            pubsub.close()
+
+    def close_segment(self):
+        if self.writer is None:
+            return
+        writer, self.writer = self.writer, None
+        writer.close()
+        logger.info(f"Closed {writer.path.name}: {writer.records} ticks")
+        if not self.trading_hours.is_open():
+            path = compact_day(writer.date)
+            logger.info(f"Compacted {writer.date:%Y%m%d} segments to {path}")
+
+
+if __name__ == '__main__':
+    _recorder = TickRecorder()
+    threading.Event().wait()
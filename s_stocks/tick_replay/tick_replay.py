@@ -0,0 +1,181 @@
+"""
+Replays a recorded trading day into a local redis stand-in so Candles, DynamicCandlesBuilder, the alerts monitor
+and DataPoller can be run offline. Services under replay run with REDIS_HOST=<local redis> and VIRTUAL_CLOCK=1.
+
+    REDIS_HOST=localhost python tick_replay.py replay 2025-10-07 --speed 10
+    REDIS_HOST=localhost python tick_replay.py replay ticks_20251007.jsonl --speed 0 --digest
+    python tick_replay.py dump ticks_20251007.jsonl          # export today's tick_stream (TICK_TRANSPORT=stream)
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from common.config import get_redis_client_v2, tick_transport, candle_shards
+from common.clock import VirtualClock
+from common.tick_codec import get_tick_codec, JsonTickCodec, parse_timestamp
+from common.tick_segment import day_dir, SegmentReader
+from common.tick_stream import queue_ticks, tick_queue_key
+
+INDEX_SYMBOLS = {"NSE:NIFTY 50", "BSE:SENSEX", "NSE:NIFTY BANK", "NSE:INDIA VIX"}
+RECORD_FIELDS = {
+    "last_price": "last_price",
+    "last_qty": "last_traded_quantity",
+    "avg_price": "average_traded_price",
+    "volume": "volume_traded",
+    "buy_qty": "total_buy_quantity",
+    "sell_qty": "total_sell_quantity",
+    "oi": "oi",
+}
+
+
+def batches_from_records(df: pd.DataFrame):
+    """tick recorder rows (RECORD_DTYPE columns + symbol) back to on_ticks batches, grouped by receive time"""
+    df = df.sort_values(["recv_ts", "exchange_ts"], kind="stable")
+    for _, group in df.groupby("recv_ts", sort=False):
+        batch = {}
+        for row in group.itertuples(index=False):
+            tick = {"tradable": row.symbol not in INDEX_SYMBOLS}
+            tick.update({name: getattr(row, col) for col, name in RECORD_FIELDS.items()})
+            tick["exchange_timestamp"] = str(datetime.datetime.fromtimestamp(row.exchange_ts))
+            batch[row.symbol] = tick
+        yield batch
+
+
+def load_day(date: datetime.date):
+    parquet_file = day_dir(date) / f"ticks_{date:%Y%m%d}.parquet"
+    if parquet_file.exists():
+        return batches_from_records(pd.read_parquet(parquet_file))
+    reader = SegmentReader(date)  # not compacted yet
+    frames = []
+    for records, symbols in reader.segments:
+        df = pd.DataFrame(np.asarray(records))
+        df["symbol"] = [symbols[i] for i in df.pop("sym_id")]
+        frames.append(df)
+    if not frames:
+        raise FileNotFoundError(f"no recorded ticks for {date}")
+    return batches_from_records(pd.concat(frames, ignore_index=True))
+
+
+def load_jsonl(path: Path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def batch_time(batch: dict):
+    times = [parse_timestamp(t["exchange_timestamp"]) for t in batch.values() if t.get("exchange_timestamp")]
+    return max(times) if times else None
+
+
+def replay(batches, speed=1.0, flush_every=1):
+    """
+    publish batches the way KiteSocket does and move the virtual clock with them
+    speed: 1 = real time, N = N times faster, 0 = as fast as redis takes it
+    """
+    codec = get_tick_codec()
+    redis_client = get_redis_client_v2(decode=not codec.binary)
+    first_market = first_wall = None
+    ticks = n_batches = 0
+    started = time.perf_counter()
+    pipe = redis_client.pipeline()
+
+    for batch in batches:
+        market_time = batch_time(batch)
+        if market_time is None:
+            continue
+        if speed and first_market is not None:
+            due = first_wall + (market_time - first_market).total_seconds() / speed
+            if (delay := due - time.perf_counter()) > 0:
+                pipe.execute()
+                time.sleep(delay)
+        elif first_market is None:
+            first_market, first_wall = market_time, time.perf_counter()
+
+        payload = codec.encode_batch(batch)
+        VirtualClock.set(pipe, market_time)
+        pipe.publish("tick_channel", payload)
+        queue_ticks(pipe, batch, codec, payload=payload)
+        pipe.hset(f"tick:{market_time:%Y%m%d}", mapping={s: json.dumps(t, default=str) for s, t in batch.items()})
+        ticks += len(batch)
+        n_batches += 1
+        if n_batches % flush_every == 0:
+            pipe.execute()
+    pipe.execute()
+
+    elapsed = time.perf_counter() - started
+    print(f"replayed {n_batches} batches / {ticks} ticks in {elapsed:.1f}s | {ticks / max(elapsed, 1e-9):,.0f} ticks/s")
+
+
+def dump(path: Path):
+    """
+    export today's tick_stream as json lines, oldest first.
+    With candle shards the per-shard keys are merged by exchange time (each shard keeps its own symbols in order).
+    Stream transport only: the 'ticks' list is popped by Candles as it builds, so it never holds the day; with the
+    list transport replay the tick recorder's data for the date instead.
+    """
+    if tick_transport != "stream":
+        raise SystemExit("dump reads tick_stream (TICK_TRANSPORT=stream); the 'ticks' list is consumed by Candles, "
+                         "replay a date from the tick recorder instead")
+    codec = get_tick_codec()
+    redis_client = get_redis_client_v2(decode=not codec.binary)
+    batches = []
+    for shard in range(candle_shards):
+        key = tick_queue_key(shard)
+        payloads = (fields.get("data", fields.get(b"data")) for _, fields in redis_client.xrange(key))
+        batches += [codec.decode_batch(payload) for payload in payloads]
+    if candle_shards > 1:
+        batches.sort(key=lambda b: batch_time(b) or datetime.datetime.min)
+    count = 0
+    with open(path, "w") as f:
+        for batch in batches:
+            f.write(JsonTickCodec.encode_batch(batch) + "\n")
+            count += 1
+    print(f"dumped {count} batches to {path}")
+
+
+def candle_digest(date: datetime.date):
+    """order independent hash of every candles{date}:* key, to compare candle output between replays"""
+    redis_client = get_redis_client_v2()
+    digest = hashlib.sha256()
+    for key in sorted(redis_client.scan_iter(f"candles{date:%Y%m%d}:*", count=1000)):
+        digest.update(key.encode())
+        for member, score in redis_client.zrange(key, 0, -1, withscores=True):
+            digest.update(f"{score}:{member}".encode())
+    return digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="tick replay for offline pipeline runs")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_replay = sub.add_parser("replay")
+    p_replay.add_argument("source", help="YYYY-MM-DD (tick recorder data) or a .jsonl dump")
+    p_replay.add_argument("--speed", type=float, default=1.0, help="1 = real time, N = N x, 0 = max")
+    p_replay.add_argument("--digest", action="store_true", help="print candle digest after replay")
+    p_replay.add_argument("--settle", type=float, default=10, help="seconds to wait for candles before digest")
+    p_dump = sub.add_parser("dump", help="export tick_stream, stream transport only")
+    p_dump.add_argument("path")
+    args = parser.parse_args()
+
+    if args.cmd == "dump":
+        return dump(Path(args.path))
+
+    if not os.environ.get("REDIS_HOST"):
+        parser.error("set REDIS_HOST to a local redis, replay must not write to the production instance")
+    if args.source.endswith(".jsonl"):
+        batches = list(load_jsonl(Path(args.source)))
+    else:
+        batches = list(load_day(datetime.date.fromisoformat(args.source)))
+    replay(batches, speed=args.speed, flush_every=1 if args.speed else 100)
+    if args.digest and batches:
+        time.sleep(args.settle)
+        print(f"candle digest: {candle_digest(batch_time(batches[-1]).date())}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+from common.expiry import Expiry
+from common.my_logger import logger
+
+
+class AtmWindow:
+    """
+    Option tokens of one underlying within n_strikes strike widths of the live index.
+    Re-centres only after the index has moved (0.5 + hysteresis) strike widths away from the current centre,
+    so a price oscillating around a strike boundary does not churn subscriptions.
+    """
+
+    def __init__(self, instrument, option_tokens: dict, n_strikes=26, hysteresis=1.0):
+        expiry = Expiry(instrument)
+        dd = expiry.get_derivative_data()
+        self.underlying = f'{dd["exchange"]}:{dd["underlying"]}'
+        self.width = expiry.get_strike_width()
+        self.n_strikes = n_strikes
+        self.hysteresis = hysteresis
+        self.by_strike = {}  # strike -> tokens (all subscribed expiries, CE + PE)
+        for token, strike in option_tokens.items():
+            self.by_strike.setdefault(int(strike), []).append(token)
+        self.center = None
+        self.tokens = set()
+
+    def window(self, center):
+        reach = self.n_strikes * self.width
+        return {t for strike, tokens in self.by_strike.items() if abs(strike - center) <= reach for t in tokens}
+
+    def update(self, price):
+        """(tokens to add, tokens to remove) when the window re-centres, else None"""
+        if self.center is not None and abs(price - self.center) < (0.5 + self.hysteresis) * self.width:
+            return None
+        center = int(round(price / self.width) * self.width)
+        tokens = self.window(center)
+        add, remove = tokens - self.tokens, self.tokens - tokens
+        if self.center is not None:
+            logger.info(f"{self.underlying} ATM window {self.center} -> {center}: +{len(add)} -{len(remove)} tokens")
+        self.center, self.tokens = center, tokens
+        return add, remove
+
+
+class AtmSubscriptions:
+    """ATM windows for the option underlyings, driven by the index ticks flowing through on_ticks"""
+
+    def __init__(self, master, inst_symbol_dict: dict, instruments=("NN", "SX"), n_strikes=26, hysteresis=1.0):
+        self.windows = {}
+        option_tokens = {}  # underlying name -> {token: strike}
+        for token, symbol in inst_symbol_dict.items():
+            info = master.describe(symbol)
+            if info and info["instrument_type"] in ("CE", "PE"):
+                option_tokens.setdefault(info["name"], {})[token] = info["strike"]
+        self.managed = set()  # option tokens whose subscription follows a window
+        for instrument in instruments:
+            name = Expiry(instrument).get_derivative_data()["derivative_name"]
+            if name in option_tokens:
+                window = AtmWindow(instrument, option_tokens[name], n_strikes=n_strikes, hysteresis=hysteresis)
+                self.windows[master.symbol_to_token.get(window.underlying)] = window
+                self.managed |= option_tokens[name].keys()
+
+    def initial_tokens(self, inst_symbol_dict: dict, kite):
+        """every non-windowed token plus the windows around the current index LTP (REST)"""
+        try:
+            ltp = kite.ltp([w.underlying for w in self.windows.values()])
+        except Exception as e:
+            logger.warning(f"ATM window LTP fetch failed, subscribing all strikes until the first index tick: {e}")
+            ltp = {}
+        tokens = {t: s for t, s in inst_symbol_dict.items() if t not in self.managed}
+        for window in self.windows.values():
+            if quote := ltp.get(window.underlying):
+                window.update(quote["last_price"])
+            else:
+                # everything for now; the first index tick centres the window and drops the rest
+                window.tokens = {t for tokens_ in window.by_strike.values() for t in tokens_}
+            tokens |= {t: inst_symbol_dict[t] for t in window.tokens}
+        return tokens
+
+    def on_ticks(self, ticks, kws, tick_modes=None):
+        """kws: SubscriptionManager; called from on_ticks on the reactor thread, which is where subscribe belongs"""
+        for tick in ticks:
+            window = self.windows.get(tick["instrument_token"])
+            if window is None or not tick.get("last_price"):
+                continue
+            if change := window.update(tick["last_price"]):
+                add, remove = change
+                kws.unsubscribe(remove)
+                changed = tick_modes.reclassify(window.tokens) if tick_modes else []  # near / far moved with the centre
+                kws.subscribe(list(add))
+                kws.refresh_modes(set(changed) - add)
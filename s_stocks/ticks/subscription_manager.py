@@ -0,0 +1,314 @@
+import time
+from kiteconnect import KiteTicker
+from twisted.internet import reactor
+from common.my_logger import logger
+
+
+class TickerShard:
+    """One KiteTicker connection and the tokens it carries"""
+
+    def __init__(self, ix, kws: KiteTicker):
+        self.ix = ix
+        self.kws = kws
+        self.tokens = []
+        self.load = 0.0
+        self.connected = False
+        self.ticks = 0
+        self.connects = 0
+        self.last_tick_time = None
+        self.rate = 0.0  # ticks/s, ewma over 1s windows
+        self.window_start = time.time()
+        self.window_ticks = 0
+        self.since = time.time()  # last (re)connect attempt, idle time counts from here until the first tick
+        self.reconnects = 0
+        self.failed_reconnects = 0  # consecutive reconnects without a tick, backs the watchdog off
+        self.reconnect_started = None
+        self.last_reconnect_ms = None
+
+    def record(self, count):
+        now = time.time()
+        self.ticks += count
+        self.window_ticks += count
+        self.last_tick_time = now
+        if (elapsed := now - self.window_start) >= 1:
+            self.rate = 0.3 * (self.window_ticks / elapsed) + 0.7 * self.rate
+            self.window_start, self.window_ticks = now, 0
+
+    def idle(self):
+        return time.time() - max(self.last_tick_time or 0, self.since)
+
+    def stats(self):
+        idle = time.time() - self.last_tick_time if self.last_tick_time else None
+        return {
+            "tokens": len(self.tokens),
+            "connected": self.connected,
+            "connects": self.connects,
+            "ticks": self.ticks,
+            "tick_rate": round(self.rate, 1),
+            "expected_rate": round(self.load, 1),  # ticks/s the balance placed here
+            "idle_sec": round(idle, 1) if idle is not None else None,
+            "reconnects": self.reconnects,
+            "last_reconnect_to_tick_ms": self.last_reconnect_ms,
+        }
+
+
+class SubscriptionManager:
+    """
+    Spreads the instrument set over n KiteTicker connections (kite caps a connection at 3000 instruments).
+    Tokens are balanced by expected ticks/s: the rate measured this session, else the one saved by an earlier session
+    (save_rates / load_rates, the counts die with the daily restart), else a per-class prior.
+    Every shard feeds the same on_ticks callback, i.e. KiteSocket's single tick queue.
+    KiteTicker instances share twisted's reactor, so shards run on the one reactor thread with one socket each.
+    A dead or silent shard is replaced in-process by a new KiteTicker on the same reactor (reconnect_stale), it
+    resubscribes from its cached token list on connect.
+    """
+    MAX_PER_SHARD = 3000
+    CLASS_RATE = {"NFO": 1.0, "BFO": 1.0, "INDICES": 0.5, "EQ": 0.25}  # ticks/s of an instrument never measured
+    RATES_KEY = "tick_rates"
+    RATES_TTL = 7 * 24 * 60 * 60
+    MIN_SAMPLE_SEC = 60  # counted time before this session's rates replace the saved ones
+
+    def __init__(self, api_key, n_shards=1, latency=None):
+        self.api_key = api_key
+        self.n_shards = n_shards
+        self.latency = latency  # LatencyRecorder, gets reconnect_to_first_tick
+        self.shards: list[TickerShard] = []
+        self.token_ticks = {}  # instrument_token -> ticks seen since counting_since
+        self.counting_since = time.time()
+        self.rates = {}  # instrument_token -> ticks/s saved by an earlier session
+        self.token_load = {}  # instrument_token -> ticks/s it added to its shard's load
+        self.callbacks = {}
+        self.mode_of = lambda token: KiteTicker.MODE_FULL
+        self.access_token = None
+        self.closing = False  # close() in progress, closes are expected rather than failures
+
+    def rate(self, token):
+        """measured ticks/s: this session's once MIN_SAMPLE_SEC have been counted, else the saved one, else None"""
+        if token in self.token_ticks and (elapsed := time.time() - self.counting_since) >= self.MIN_SAMPLE_SEC:
+            return self.token_ticks[token] / elapsed
+        return self.rates.get(token)
+
+    def weight(self, token, symbol=None):
+        """expected ticks/s of a token; without a symbol (tokens the ATM window adds later) it is taken as an option"""
+        if (rate := self.rate(token)) is not None:
+            return rate
+        exchange = symbol.split(":", 1)[0] if symbol else "NFO"
+        if exchange in ("NFO", "BFO"):
+            return self.CLASS_RATE[exchange]
+        # kite tokens carry the segment in the low byte, 9 = indices
+        return self.CLASS_RATE["INDICES"] if token % 256 == 9 else self.CLASS_RATE["EQ"]
+
+    def balance(self, inst_symbol_dict: dict):
+        """greedy largest-first assignment to the least loaded shard with room"""
+        n_shards = max(self.n_shards, -(-len(inst_symbol_dict) // self.MAX_PER_SHARD))
+        if n_shards != self.n_shards:
+            logger.warning(f"{len(inst_symbol_dict)} instruments need {n_shards} ticker shards (configured "
+                           f"{self.n_shards})")
+        loads = [[0.0, []] for _ in range(n_shards)]
+        weighted = sorted(((self.weight(t, s), t) for t, s in inst_symbol_dict.items()), reverse=True)
+        for weight, token in weighted:
+            load = min((l for l in loads if len(l[1]) < self.MAX_PER_SHARD), key=lambda l: l[0])
+            load[0] += weight
+            load[1].append(token)
+            self.token_load[token] = weight
+        return loads
+
+    def connect(self, access_token, inst_symbol_dict: dict, on_ticks, on_connect=None, on_close=None, on_error=None,
+                on_noreconnect=None, mode_of=None):
+        self.callbacks = dict(on_ticks=on_ticks, on_connect=on_connect, on_close=on_close, on_error=on_error,
+                              on_noreconnect=on_noreconnect)
+        self.shards = []
+        self.access_token = access_token
+        self.closing = False
+        self.token_load = {}
+        if not self.token_ticks:
+            self.counting_since = time.time()
+        if mode_of:
+            self.mode_of = mode_of
+        for ix, (load, tokens) in enumerate(l for l in self.balance(inst_symbol_dict) if l[1]):
+            shard = TickerShard(ix, KiteTicker(self.api_key, access_token))
+            shard.tokens, shard.load = tokens, load
+            self._bind(shard)
+            self.shards.append(shard)
+
+        for shard in self.shards:
+            logger.info(f"ticker shard {shard.ix}: {len(shard.tokens)} tokens, load {shard.load:.1f} ticks/s")
+            if shard is self.shards[0]:
+                shard.kws.connect(threaded=True)  # dials and starts the reactor thread
+            else:
+                # twisted is not thread safe: dial on the reactor thread (queued until it runs), where the
+                # reactor is already running so no second one is started
+                reactor.callFromThread(shard.kws.connect, threaded=True)
+
+    def _set_modes(self, ws, tokens):
+        by_mode = {}
+        for token in tokens:
+            by_mode.setdefault(self.mode_of(token), []).append(token)
+        for mode, mode_tokens in by_mode.items():
+            ws.set_mode(mode, mode_tokens)
+
+    def _bind(self, shard: TickerShard):
+        cb = self.callbacks
+
+        def on_connect(ws, response):
+            if ws is not shard.kws:
+                return
+            logger.info(f"WebSocket shard {shard.ix} connected: {response}")
+            shard.connected = True
+            shard.connects += 1
+            ws.subscribe(shard.tokens)
+            self._set_modes(ws, shard.tokens)
+            if cb["on_connect"]:
+                cb["on_connect"](ws, response)
+
+        def on_ticks(ws, ticks):
+            if ws is not shard.kws:
+                return  # a replaced connection still draining
+            if shard.reconnect_started is not None:
+                elapsed = time.time() - shard.reconnect_started
+                shard.reconnect_started, shard.failed_reconnects = None, 0
+                shard.last_reconnect_ms = round(elapsed * 1000)
+                logger.info(f"shard {shard.ix} first tick {shard.last_reconnect_ms}ms after reconnect")
+                if self.latency:
+                    self.latency.record("reconnect_to_first_tick", elapsed)
+            shard.record(len(ticks))
+            for tick in ticks:
+                token = tick["instrument_token"]
+                self.token_ticks[token] = self.token_ticks.get(token, 0) + 1
+            cb["on_ticks"](ws, ticks)
+
+        def on_close(ws, code, reason):
+            if ws is not shard.kws:
+                return
+            shard.connected = False
+            if cb["on_close"]:
+                cb["on_close"](ws, code, reason)
+
+        def on_error(ws, code, reason):
+            if ws is not shard.kws:
+                return
+            shard.connected = False
+            if cb["on_error"]:
+                cb["on_error"](ws, code, reason)
+
+        def on_reconnect(ws, attempts):
+            _ = ws
+            logger.info(f"Shard {shard.ix} reconnecting... Attempt {attempts}")
+
+        def on_noreconnect(ws):
+            if ws is not shard.kws:
+                return
+            shard.connected = False
+            if cb["on_noreconnect"]:
+                cb["on_noreconnect"](ws)
+
+        shard.kws.on_connect = on_connect
+        shard.kws.on_ticks = on_ticks
+        shard.kws.on_close = on_close
+        shard.kws.on_error = on_error
+        shard.kws.on_reconnect = on_reconnect
+        shard.kws.on_noreconnect = on_noreconnect
+
+    def subscribe(self, tokens):
+        """add tokens to the least loaded shard with room; a shard that is down picks them up on reconnect"""
+        if not tokens or not self.shards:
+            return
+        shard = min((s for s in self.shards if len(s.tokens) + len(tokens) <= self.MAX_PER_SHARD),
+                    key=lambda s: s.load, default=None)
+        if shard is None:
+            logger.warning(f"no ticker shard has room for {len(tokens)} more tokens")
+            return
+        shard.tokens.extend(tokens)
+        for token in tokens:
+            self.token_load[token] = self.weight(token)
+            shard.load += self.token_load[token]
+        if shard.connected:
+            shard.kws.subscribe(tokens)
+            self._set_modes(shard.kws, tokens)
+
+    def unsubscribe(self, tokens):
+        tokens = set(tokens)
+        for shard in self.shards:
+            if drop := [t for t in shard.tokens if t in tokens]:
+                shard.tokens = [t for t in shard.tokens if t not in tokens]
+                shard.load -= sum(self.token_load.pop(t, 0.0) for t in drop)
+                if shard.connected:
+                    shard.kws.unsubscribe(drop)
+
+    def refresh_modes(self, tokens):
+        """re-apply mode_of to subscribed tokens, e.g. after near / far options moved with the ATM"""
+        tokens = set(tokens)
+        for shard in self.shards:
+            if shard.connected and (owned := [t for t in shard.tokens if t in tokens]):
+                self._set_modes(shard.kws, owned)
+
+    def load_rates(self, redis_client):
+        """ticks/s per token saved by earlier sessions, the balance's estimate before this session has measured"""
+        self.rates = {int(token): float(rate) for token, rate in redis_client.hgetall(self.RATES_KEY).items()}
+        logger.info(f"loaded tick rates of {len(self.rates)} instruments")
+
+    def save_rates(self, redis_client):
+        """this session's ticks/s per subscribed token (0 for silent ones), merged into the saved rates"""
+        elapsed = time.time() - self.counting_since
+        tokens = {t for shard in self.shards for t in shard.tokens}
+        if elapsed < self.MIN_SAMPLE_SEC or not tokens:
+            return
+        rates = {t: round(self.token_ticks.get(t, 0) / elapsed, 4) for t in tokens}
+        pipe = redis_client.pipeline()
+        pipe.hset(self.RATES_KEY, mapping=rates)
+        pipe.expire(self.RATES_KEY, self.RATES_TTL)
+        pipe.execute()
+        logger.info(f"saved tick rates of {len(rates)} instruments over {elapsed:.0f}s")
+
+    def feed(self, ticks):
+        """
+        hand ticks from another source (REST backfill) to the shared on_ticks callback, on the reactor thread like
+        shard ticks, since on_ticks may subscribe / unsubscribe (ATM window) and twisted is not thread safe
+        """
+        if ticks and self.callbacks.get("on_ticks"):
+            reactor.callFromThread(self.callbacks["on_ticks"], None, ticks)
+
+    def reconnect(self, shard: TickerShard):
+        """replace the shard's KiteTicker; the reactor keeps running, so no process restart is needed"""
+        logger.warning(f"reconnecting ticker shard {shard.ix} ({len(shard.tokens)} tokens, idle {shard.idle():.0f}s)")
+        old = shard.kws
+        shard.kws = KiteTicker(self.api_key, self.access_token)
+        shard.connected = False
+        shard.reconnects += 1
+        shard.failed_reconnects += 1
+        shard.since = shard.reconnect_started = time.time()
+        self._bind(shard)
+
+        def swap():
+            # twisted is not thread safe: close the old socket and dial the new one on the reactor thread
+            try:
+                old.stop_retry()
+                old.close()
+            except Exception as e:
+                logger.error(f"shard {shard.ix} close error: {e}")
+            shard.kws.connect(threaded=True)
+
+        reactor.callFromThread(swap)
+
+    def reconnect_stale(self, stale_sec=10, max_backoff=60):
+        """reconnect shards that are down or silent for stale_sec (doubling per attempt without a tick)"""
+        if self.closing:
+            return []
+        reconnected = []
+        for shard in self.shards:
+            limit = min(stale_sec * 2 ** shard.failed_reconnects, max_backoff)
+            if shard.idle() >= limit or (not shard.connected and time.time() - shard.since >= limit):
+                self.reconnect(shard)
+                reconnected.append(shard)
+        return reconnected
+
+    def close(self):
+        self.closing = True
+        for shard in self.shards:
+            shard.kws.close()
+
+    def all_closed(self):
+        return not any(shard.connected for shard in self.shards)
+
+    def stats(self):
+        return {f"shard_{shard.ix}": shard.stats() for shard in self.shards}
@@ -0,0 +1,49 @@
+import threading
+from twisted.internet import reactor
+from subscription_manager import SubscriptionManager, TickerShard
+
+
+class RecordingTicker:
+    """stands in for a connected KiteTicker, remembering the thread each call came from"""
+
+    def __init__(self):
+        self.calls = []
+
+    def subscribe(self, tokens):
+        self.calls.append(("subscribe", threading.get_ident()))
+
+    def unsubscribe(self, tokens):
+        self.calls.append(("unsubscribe", threading.get_ident()))
+
+    def set_mode(self, mode, tokens):
+        self.calls.append(("set_mode", threading.get_ident()))
+
+
+def test_backfill_feed_subscribes_on_reactor_thread():
+    """REST backfill runs on a worker thread; the ATM (un)subscribes its ticks trigger must reach twisted's thread"""
+    reactor_thread = {}
+    reactor.callWhenRunning(lambda: reactor_thread.setdefault("ident", threading.get_ident()))
+    threading.Thread(target=reactor.run, kwargs=dict(installSignalHandlers=False), daemon=True).start()
+
+    manager = SubscriptionManager("api_key")
+    shard = TickerShard(0, RecordingTicker())
+    shard.connected = True
+    manager.shards = [shard]
+    done = threading.Event()
+
+    def on_ticks(ws, ticks):  # what AtmSubscriptions.on_ticks does when the window re-centres
+        manager.unsubscribe([1])
+        manager.subscribe([t["instrument_token"] for t in ticks])
+        done.set()
+
+    manager.callbacks = dict(on_ticks=on_ticks)
+    backfill = threading.Thread(target=manager.feed, args=([{"instrument_token": 2, "last_price": 100.0}],))
+    backfill.start()
+    backfill.join()
+    try:
+        assert done.wait(5)
+    finally:
+        reactor.callFromThread(reactor.stop)
+    assert [name for name, _ in shard.kws.calls] == ["subscribe", "set_mode"]
+    assert {ident for _, ident in shard.kws.calls} == {reactor_thread["ident"]}
+    assert reactor_thread["ident"] != backfill.ident
@@ -0,0 +1,68 @@
+import threading
+
+
+class TickCoalescer:
+    """
+    Latest tick per instrument_token between on_ticks and the tick:{date} hash.
+    A flush only returns instruments whose last_price / volume / oi moved since the last write.
+    """
+    CHANGE_FIELDS = ("last_price", "volume_traded", "oi")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}  # instrument_token -> (symbol, tick)
+        self.last_written = {}  # instrument_token -> CHANGE_FIELDS values
+        self.received = 0
+        self.coalesced = 0
+        self.unchanged = 0
+        self.written = 0
+
+    def add(self, ticks: dict):
+        """ticks: {symbol: tick} as built in on_ticks"""
+        with self.lock:
+            for symbol, tick in ticks.items():
+                token = tick.get("instrument_token", symbol)
+                if token in self.pending:
+                    self.coalesced += 1
+                self.pending[token] = (symbol, tick)
+            self.received += len(ticks)
+
+    def drain(self):
+        """pending ticks that changed since last write: {instrument_token: (symbol, tick)}"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            changed = {}
+            for token, (symbol, tick) in pending.items():
+                values = tuple(tick.get(f) for f in self.CHANGE_FIELDS)
+                if self.last_written.get(token) == values:
+                    self.unchanged += 1
+                    continue
+                self.last_written[token] = values
+                changed[token] = (symbol, tick)
+            self.written += len(changed)
+            return changed
+
+    def requeue(self, changed: dict):
+        """put back a drained set after a failed write, unless a newer tick already arrived"""
+        with self.lock:
+            self.written -= len(changed)
+            for token, item in changed.items():
+                self.last_written.pop(token, None)
+                self.pending.setdefault(token, item)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "received": self.received,
+                "coalesced": self.coalesced,
+                "unchanged": self.unchanged,
+                "written": self.written,
+                "saved": self.received - self.written,
+                "pending": len(self.pending),
+            }
+
+    def reset(self):
+        with self.lock:
+            self.pending.clear()
+            self.last_written.clear()
+            self.received = self.coalesced = self.unchanged = self.written = 0
@@ -0,0 +1,107 @@
+import time
+from common.my_logger import logger
+
+
+class TickModes:
+    """
+    Subscription mode and field projection per instrument class.
+    near/far options follow the ATM windows (TICK_ATM_WINDOW); without them every option counts as near.
+    Every class defaults to full; for a class opted in to quote / ltp, projection also strips the fields nobody
+    downstream reads of it before the tick is queued and encoded. Full mode ticks pass through untouched.
+    """
+    CLASSES = ("indices", "equities", "near_options", "far_options")
+    # websocket packet bytes per mode, https://kite.trade/docs/connect/v3/websocket/
+    PACKET_BYTES = {"index": {"ltp": 8, "quote": 28, "full": 32}, "tradable": {"ltp": 8, "quote": 44, "full": 184}}
+    DROP_FIELDS = {
+        "indices": set(),
+        "equities": {"depth", "total_buy_quantity", "total_sell_quantity", "oi", "oi_day_high", "oi_day_low"},
+        "near_options": set(),
+        "far_options": {"depth"},
+    }
+
+    def __init__(self, modes: dict, near_strikes=5, codec=None, sample_every=50):
+        unknown = set(modes) - set(self.CLASSES)
+        if unknown:
+            raise ValueError(f"unknown tick mode classes {unknown}, expected {self.CLASSES}")
+        self.modes = {c: "full" for c in self.CLASSES} | modes
+        self.drop_fields = {c: self.DROP_FIELDS[c] if self.modes[c] != "full" else set() for c in self.CLASSES}
+        self.near_strikes = near_strikes
+        self.codec = codec
+        self.sample_every = sample_every
+        self.token_class = {}
+        self.token_strike = {}  # option token -> (window, strike)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.started = time.time()
+        self.class_ticks = dict.fromkeys(self.CLASSES, 0)
+        self.batches = 0
+        self.sampled_raw = 0
+        self.sampled_projected = 0
+
+    def classify(self, token, symbol, atm=None):
+        if token in self.token_strike:
+            window, strike = self.token_strike[token]
+            if window.center is None or abs(strike - window.center) <= self.near_strikes * window.width:
+                return "near_options"
+            return "far_options"
+        if token % 256 == 9:  # kite segment byte 9 = indices
+            return "indices"
+        if symbol.startswith(("NSE:", "BSE:")):
+            return "equities"
+        return "near_options"
+
+    def set_classes(self, inst_symbol_dict: dict, atm=None):
+        self.token_strike = {}
+        if atm:
+            for window in atm.windows.values():
+                for strike, tokens in window.by_strike.items():
+                    self.token_strike |= {t: (window, strike) for t in tokens}
+        self.token_class = {t: self.classify(t, s) for t, s in inst_symbol_dict.items()}
+        counts = {c: sum(1 for v in self.token_class.values() if v == c) for c in self.CLASSES}
+        logger.info(f"tick modes {self.modes} | instruments per class {counts}")
+
+    def reclassify(self, tokens):
+        """after an ATM re-centre; returns the tokens whose class changed"""
+        changed = []
+        for token in tokens:
+            cls = self.classify(token, "")
+            if self.token_class.get(token) != cls:
+                self.token_class[token] = cls
+                changed.append(token)
+        return changed
+
+    def mode_of(self, token):
+        return self.modes[self.token_class.get(token, "near_options")]
+
+    def project(self, ticks: list, inst_symbol_dict: dict):
+        """on_ticks list -> {symbol: projected tick}"""
+        batch = {}
+        for tick in ticks:
+            cls = self.token_class.get(tick["instrument_token"], "near_options")
+            self.class_ticks[cls] += 1
+            drop = self.drop_fields[cls]
+            if drop:
+                tick = {k: v for k, v in tick.items() if k not in drop}
+            batch[inst_symbol_dict.get(tick["instrument_token"], "NA")] = tick
+        self.batches += 1
+        if self.codec and self.batches % self.sample_every == 0:
+            raw = {inst_symbol_dict.get(t["instrument_token"], "NA"): t for t in ticks}
+            self.sampled_raw += len(self.codec.encode_batch(raw))
+            self.sampled_projected += len(self.codec.encode_batch(batch))
+        return batch
+
+    def stats(self):
+        elapsed = max(time.time() - self.started, 1e-9)
+        ws_saved = 0
+        for cls, count in self.class_ticks.items():
+            sizes = self.PACKET_BYTES["index" if cls == "indices" else "tradable"]
+            ws_saved += count * (sizes["full"] - sizes[self.modes[cls]])
+        encoded_saved = (self.sampled_raw - self.sampled_projected) * self.sample_every
+        return {
+            "modes": self.modes,
+            "ticks": self.class_ticks,
+            "ws_bytes_saved_per_sec": round(ws_saved / elapsed),
+            "encoded_bytes_saved_per_sec": round(encoded_saved / elapsed),
+            "projection_ratio": round(self.sampled_projected / self.sampled_raw, 3) if self.sampled_raw else None,
+        }
@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import deque
+
+
+class TickQueue:
+    """
+    Bounded queue of on_ticks batches ({symbol: tick}, receive time) with a drop policy for when redis falls behind
+    drop_oldest: evict the oldest batch
+    conflate: merge the new batch into the newest queued one, keeping only the latest tick per symbol
+    block: make the producer wait up to block_timeout for room, then drop the oldest batch. Only for producers that
+    may wait: a put(block=False) caller (on_ticks, on twisted's reactor thread) is conflated instead
+    """
+    POLICIES = ("drop_oldest", "conflate", "block")
+
+    def __init__(self, maxlen=5000, policy="drop_oldest", block_timeout=1.0):
+        if policy not in self.POLICIES:
+            raise ValueError(f"unknown tick queue policy '{policy}', expected one of {self.POLICIES}")
+        self.maxlen = maxlen
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.dq = deque()
+        self.cond = threading.Condition()
+        self.dropped_batches = 0
+        self.dropped_ticks = 0
+        self.conflated_ticks = 0
+        self.max_depth = 0
+
+    def __len__(self):
+        return len(self.dq)
+
+    def put(self, batch: dict, recv_ts=None, block=True):
+        with self.cond:
+            if len(self.dq) >= self.maxlen:
+                if self.policy == "conflate" or (self.policy == "block" and not block):
+                    newest = self.dq[-1][0]  # keeps the older receive time, so latency is not understated
+                    self.conflated_ticks += len(newest.keys() & batch.keys())
+                    newest.update(batch)
+                    self.cond.notify()
+                    return
+                if self.policy == "block":
+                    self.cond.wait_for(lambda: len(self.dq) < self.maxlen, timeout=self.block_timeout)
+                if len(self.dq) >= self.maxlen:
+                    self.dropped_batches += 1
+                    self.dropped_ticks += len(self.dq.popleft()[0])
+            self.dq.append((batch, recv_ts or time.time()))
+            self.max_depth = max(self.max_depth, len(self.dq))
+            self.cond.notify()
+
+    def wait(self, timeout=None):
+        """True once something is queued"""
+        with self.cond:
+            return self.cond.wait_for(lambda: self.dq, timeout=timeout)
+
+    def get_batch(self, count):
+        """[(batch, recv_ts)], oldest first"""
+        with self.cond:
+            batch = [self.dq.popleft() for _ in range(min(count, len(self.dq)))]
+            self.cond.notify_all()
+            return batch
+
+    def trim_before(self, ts):
+        """drop batches received before ts (a standby only keeps the window it may have to replay)"""
+        with self.cond:
+            trimmed = 0
+            while self.dq and self.dq[0][1] < ts:
+                self.dq.popleft()
+                trimmed += 1
+            if trimmed:
+                self.cond.notify_all()
+            return trimmed
+
+    def clear(self):
+        with self.cond:
+            self.dq.clear()
+            self.cond.notify_all()
+
+    def stats(self):
+        return {
+            "policy": self.policy,
+            "depth": len(self.dq),
+            "max_depth": self.max_depth,
+            "maxlen": self.maxlen,
+            "dropped_batches": self.dropped_batches,
+            "dropped_ticks": self.dropped_ticks,
+            "conflated_ticks": self.conflated_ticks,
+        }
+
+
+class FlushSizer:
+    """
+    Sizes each redis pipeline from the measured per-batch cost so a flush takes about target_ms,
+    and grows it when the backlog is deep so the queue drains instead of building up.
+    """
+
+    def __init__(self, target_ms=50, min_size=10, max_size=2000, alpha=0.2):
+        self.target = target_ms / 1000
+        self.min_size = min_size
+        self.max_size = max_size
+        self.alpha = alpha
+        self.per_batch = None  # ewma seconds per queued batch
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.flushes = 0
+        self.last_size = 0
+
+    def size(self, depth):
+        if self.per_batch is None:
+            size = self.min_size
+        else:
+            size = int(self.target / max(self.per_batch, 1e-6))
+        # deep backlog: take a larger share per pipeline rather than waiting for more wake-ups
+        size = max(size, depth // 4)
+        self.last_size = max(self.min_size, min(self.max_size, size, depth))
+        return self.last_size
+
+    def record(self, count, started):
+        elapsed = time.perf_counter() - started
+        if count:
+            per_batch = elapsed / count
+            self.per_batch = per_batch if self.per_batch is None else (
+                    self.alpha * per_batch + (1 - self.alpha) * self.per_batch)
+        self.flushes += 1
+        self.last_flush_ms = elapsed * 1000
+        self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+
+    def stats(self):
+        return {
+            "flushes": self.flushes,
+            "last_size": self.last_size,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
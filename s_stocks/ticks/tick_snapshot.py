@@ -0,0 +1,63 @@
+import threading
+from collections import OrderedDict
+
+
+class TickSnapshot:
+    """
+    Latest tick per symbol with a sequence number bumped on every on_ticks batch.
+    Symbols are kept in update order, so since(seq) walks back only over what changed after seq.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latest = OrderedDict()  # symbol -> (seq, tick), oldest update first
+        self.seq = 0
+        self.base_seq = 0  # seq at the last reset; older cursors get a full snapshot
+
+    def __len__(self):
+        return len(self.latest)
+
+    def update(self, ticks: dict):
+        """ticks: {symbol: tick} as built in on_ticks"""
+        if not ticks:
+            return self.seq
+        with self.lock:
+            self.seq += 1
+            for symbol, tick in ticks.items():
+                self.latest[symbol] = (self.seq, tick)
+                self.latest.move_to_end(symbol)
+            return self.seq
+
+    def since(self, seq=None):
+        """
+        {"seq", "full", "ticks"}: symbols updated after seq, or everything when seq is missing, from before the
+        last reset or ahead of this process (a client that outlived a restart). Poll again with the returned seq.
+        """
+        with self.lock:
+            if seq is None or seq <= self.base_seq or seq > self.seq:
+                return {"seq": self.seq, "full": True, "ticks": {s: tick for s, (_, tick) in self.latest.items()}}
+            changed = {}
+            for symbol in reversed(self.latest):
+                symbol_seq, tick = self.latest[symbol]
+                if symbol_seq <= seq:
+                    break
+                changed[symbol] = tick
+            return {"seq": self.seq, "full": False, "ticks": changed}
+
+    def get(self, symbol):
+        with self.lock:
+            item = self.latest.get(symbol)
+            return item[1] if item else None
+
+    def get_many(self, symbols):
+        """{symbol: tick} for the symbols that have ticked; unknown symbols are left out"""
+        with self.lock:
+            return {s: self.latest[s][1] for s in symbols if s in self.latest}
+
+    def reset(self):
+        with self.lock:
+            self.latest.clear()
+            self.base_seq = self.seq
+
+    def stats(self):
+        return {"symbols": len(self.latest), "seq": self.seq}
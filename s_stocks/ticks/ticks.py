@@ -1,10 +1,11 @@
 import time
 import threading
-import pandas as pd
 import redis
 from gunicorn.sock import BaseSocket
-from kiteconnect import KiteTicker, KiteConnect
-from common.config import data_dir, base_dir_prv, redis_host, redis_port, redis_db
+from kiteconnect import KiteConnect
+from common.config import data_dir, base_dir_prv, redis_host, redis_port, redis_db, get_redis_client_v2
+from common.config import tick_queue_maxlen, tick_queue_policy, tick_shards
+from common.config import tick_atm_window, tick_atm_hysteresis, tick_modes, tick_near_strikes, tick_lease_ttl_ms
 import json
 import datetime
 from common.my_logger import logger
@@ -13,10 +14,21 @@ from common.telegram_bot import TelegramBotStocks
 from common.utils import Encrypt
 import os
 import sys
-from collections import deque
 from pathlib import Path
 from common.base_service import BaseService
 from common_library.config.redis_config import get_redis_client
+from common.tick_codec import get_tick_codec
+from common.tick_stream import queue_ticks
+from common.latency import LatencyRecorder
+from common.tick_codec import parse_timestamp
+from common.instruments import InstrumentMaster
+from common.leader_lease import LeaderLease
+from tick_coalescer import TickCoalescer
+from tick_snapshot import TickSnapshot
+from tick_queue import TickQueue, FlushSizer
+from subscription_manager import SubscriptionManager
+from atm_window import AtmSubscriptions
+from tick_modes import TickModes
 
 with open(data_dir / f'brokers.json', 'r') as f:
     broker_data = json.loads(f.read())
@@ -26,6 +38,32 @@ tbot = TelegramBotStocks(send_only=True)
 module_name = Path(__file__).stem
 
 
+def quote_to_tick(quote: dict):
+    """kite.quote() entry -> KiteTicker full mode tick; fields the quote lacks are left out, as the ticker does"""
+    close = quote.get("ohlc", {}).get("close") or 0
+    last_price = quote.get("last_price")
+    tick = {
+        "tradable": quote["instrument_token"] % 256 != 9,
+        "mode": "full",
+        "instrument_token": quote["instrument_token"],
+        "last_price": last_price,
+        "last_traded_quantity": quote.get("last_quantity"),
+        "average_traded_price": quote.get("average_price"),
+        "volume_traded": quote.get("volume"),
+        "total_buy_quantity": quote.get("buy_quantity"),
+        "total_sell_quantity": quote.get("sell_quantity"),
+        "ohlc": quote.get("ohlc"),
+        "change": (last_price - close) * 100 / close if close and last_price is not None else 0,
+        "last_trade_time": quote.get("last_trade_time"),
+        "oi": quote.get("oi"),
+        "oi_day_high": quote.get("oi_day_high"),
+        "oi_day_low": quote.get("oi_day_low"),
+        "exchange_timestamp": quote.get("timestamp"),
+        "depth": quote.get("depth"),
+    }
+    return {k: v for k, v in tick.items() if v is not None}
+
+
 class KiteSocket(BaseService):
 
     def __init__(self, client_id: str = "YM3006"):
@@ -39,88 +77,113 @@ class KiteSocket(BaseService):
         self.redis = redis.Redis(host=redis_host, port=redis_port, db=redis_db, decode_responses=True)
         self.redis = get_redis_client(port_ix=0)
         self.redis_1 = get_redis_client(port_ix=1)
+        self.codec = get_tick_codec()
+        self.redis_ticks = get_redis_client_v2(port_ix=0, decode=not self.codec.binary)
         self.trading_hour = TradingHours(start_buffer=60)
         # self.rp = self.redis_client.pipeline()
-        self.kws = None  # WebSocket instance
-        self.kws_id = None
+        self.latency = LatencyRecorder(module_name)
+        # one or more KiteTicker connections
+        self.kws = SubscriptionManager(self.api_key, n_shards=tick_shards, latency=self.latency)
         self.kws_closed_event = threading.Event()
+        self.atm = None  # ATM strike windows when TICK_ATM_WINDOW is set
+        self.tick_modes = TickModes(tick_modes, near_strikes=tick_near_strikes, codec=self.codec)
         self.kite = KiteConnect(self.api_key)
         self.last_tick_time = time.time()
-        self.ticks = {}
-        self.tick_dq = deque(deque(maxlen=5000))  # old ticks auto-evicted
+        self.ticks = TickSnapshot()  # latest tick per symbol served by ticks_api
+        self.tick_dq = TickQueue(maxlen=tick_queue_maxlen, policy=tick_queue_policy)
+        self.flush_sizer = FlushSizer()
+        self.coalescer = TickCoalescer()  # latest tick per instrument for the tick:{date} hash
+        # hot standby: both instances stay connected, only the lease holder publishes
+        self.lease = LeaderLease(self.redis, "ticks", ttl_ms=tick_lease_ttl_ms) if tick_lease_ttl_ms else None
         self.is_running = False
         self.date_str = None
-        self.new_tick_event = threading.Event()
         self.start()
 
     def start(self):
         threading.Thread(target=self.monitor, daemon=True).start()
         threading.Thread(target=self.dump_ticks_to_redis, daemon=True).start()
+        threading.Thread(target=self.publish_stats, daemon=True).start()
+        if self.lease:
+            self.lease.start(healthy=self.feed_healthy)
+
+    def feed_healthy(self, stale_sec=5):
+        """connected and ticking; a leader that stops ticking hands the lease to the standby"""
+        return self.is_running and time.time() - self.last_tick_time < stale_sec
+
+    def is_leader(self):
+        return self.lease is None or self.lease.is_leader
 
     def get_access_token(self):
         return self.redis.get(f'access_token:{self.client_id}')
 
     def start_kiteticker(self, access_token):
         access_token = access_token if access_token else self.get_access_token()
-        self.kws = KiteTicker(self.api_key, access_token)
-        self.kws_id = id(self.kws)
         self.kite.set_access_token(access_token)
+        if self.inst_symbol_dict is None:
+            self.inst_symbol_dict = self.get_inst()
+        subscribe_dict = self.inst_symbol_dict
+        self.atm = None
+        if tick_atm_window:
+            try:
+                self.atm = AtmSubscriptions(InstrumentMaster.get(kite=self.kite), self.inst_symbol_dict,
+                                            n_strikes=tick_atm_window, hysteresis=tick_atm_hysteresis)
+                subscribe_dict = self.atm.initial_tokens(self.inst_symbol_dict, self.kite)
+                logger.info(f"ATM window mode: {len(subscribe_dict)} of {len(self.inst_symbol_dict)} instruments")
+            except Exception as e:
+                # no master, no window: every strike rather than no feed
+                logger.info(f"ATM window unavailable, subscribing all instruments: {e}")
+                self.atm, subscribe_dict = None, self.inst_symbol_dict
+        self.tick_modes.set_classes(self.inst_symbol_dict, self.atm)
 
         def on_connect(ws, response):
-            logger.info(f"WebSocket connected: {response}")
+            _ = ws, response
             tbot.send("WebSocket connected")
-            if self.inst_symbol_dict is None:
-                self.inst_symbol_dict = self.get_inst()
-            tokens = list(self.inst_symbol_dict)
-            ws.subscribe(tokens)
-            ws.set_mode(ws.MODE_FULL, tokens)
 
         def on_ticks(ws, ticks):
-            if not self.is_running or self.inst_symbol_dict is None:  # or id(ws) != self.kws_id:
+            if not self.is_running or self.inst_symbol_dict is None:
                 return
             _ = ws
             self.last_tick_time = time.time()
-            cur_tick = {self.inst_symbol_dict.get(tick["instrument_token"], "NA"): tick for tick in ticks}
-            # self.ticks |= cur_tick
-            self.tick_dq.append(cur_tick)
-            self.new_tick_event.set()
-
+            if exchange_times := [t["exchange_timestamp"] for t in ticks if t.get("exchange_timestamp")]:
+                self.latency.record_since("exchange_to_receive", parse_timestamp(max(exchange_times)).timestamp())
+            if self.atm:
+                self.atm.on_ticks(ticks, self.kws, self.tick_modes)
+            cur_tick = self.tick_modes.project(ticks, self.inst_symbol_dict)  # {symbol: tick} minus unused fields
+            self.ticks.update(cur_tick)
+            self.coalescer.add(cur_tick)
+            self.tick_dq.put(cur_tick, self.last_tick_time, block=False)  # never stall the reactor thread
 
         def on_close(ws, code, reason):
             _ = code
             logger.info(f"WebSocket closed: {reason}")
-            ws.stop_retry()
+            ws.stop_retry()  # heartbeat_check reconnects the shard in-process
             self.kws_closed_event.set()
-            self.is_running = False
+            if self.kws.closing:
+                self.is_running = not self.kws.all_closed()
 
         def on_error(ws, code, reason):
             _ = ws
             _ = code
             logger.error(f"WebSocket Error: {reason}")
             self.kws_closed_event.set()
-            self.is_running = False
-
-        def on_reconnect(ws, attempts):
-            _ = ws
-            logger.info(f"Reconnecting... Attempt {attempts}")
+            if self.kws.closing:
+                self.is_running = not self.kws.all_closed()
 
         def on_noreconnect(ws):
             _ = ws
-            logger.info("Reconnect failed. Exiting.")
-            self.is_running = False
+            logger.info("Reconnect failed, leaving it to heartbeat_check.")
             self.kws_closed_event.set()
+            if self.kws.closing:
+                self.is_running = not self.kws.all_closed()
 
-        # Define WebSocket event handlers
-        self.kws.on_connect = on_connect
-        self.kws.on_ticks = on_ticks
-        self.kws.on_close = on_close
-        self.kws.on_error = on_error
-        self.kws.on_reconnect = on_reconnect
-        self.kws.on_noreconnect = on_noreconnect
-
-        # Start WebSocket in a separate thread
-        # threading.Thread(target=self.kws.connect, kwargs={"threaded": True}, daemon=True).start()
-        self.kws.connect(threaded=True)
+        try:
+            self.kws.load_rates(self.redis)  # yesterday's per-token tick rates balance the shards
+        except redis.RedisError as e:
+            logger.error(f"Tick rates not loaded, balancing by instrument class: {e}")
+        # Start WebSocket shards, all feeding on_ticks -> tick_dq
+        self.kws.connect(access_token, subscribe_dict, on_ticks=on_ticks, on_connect=on_connect,
+                         on_close=on_close, on_error=on_error, on_noreconnect=on_noreconnect,
+                         mode_of=self.tick_modes.mode_of)
 
     def dump_ticks_to_redis(self):
         while True:
@@ -131,28 +194,65 @@ class KiteSocket(BaseService):
                 continue
 
             # Wait until tick_dq is populated
-            self.new_tick_event.wait(timeout=1)
-            self.new_tick_event.clear()
+            if not self.tick_dq.wait(timeout=1):
+                continue
 
-            if not self.tick_dq:
+            if not self.is_leader():
+                # standby: keep one lease ttl of ticks, published on takeover to cover the leader's last moments
+                self.tick_dq.trim_before(time.time() - self.lease.ttl)
+                time.sleep(0.05)
                 continue
 
+            changed = {}
+            started = time.perf_counter()
+            batches = self.tick_dq.get_batch(self.flush_sizer.size(len(self.tick_dq)))
             try:
                 hash_key = f'tick:{self.date_str}'
-                list_key = 'ticks'
-                with self.redis.pipeline() as pipe:
-                    for _ in range(min(100, len(self.tick_dq))):
-                        tick = self.tick_dq.popleft()
-                        tick_json = json.dumps(tick, default=str)
-                        pipe.publish("tick_channel", tick_json)
-                        pipe.lpush(list_key, tick_json)
-                        for key, value in tick.items():
-                            pipe.hset(hash_key, key, json.dumps(value, default=str))
+                queue_keys = set()
+                with self.redis_ticks.pipeline() as pipe:
+                    for tick, _ in batches:
+                        tick_payload = self.codec.encode_batch(tick)
+                        pipe.publish("tick_channel", tick_payload)
+                        # 'ticks' / tick_stream for the candle builders, one key per shard when sharded
+                        queue_keys.update(queue_ticks(pipe, tick, self.codec, payload=tick_payload))
+                    # hash stays json: read by alerts / dev_api as the human facing latest value
+                    if changed := self.coalescer.drain():
+                        mapping = {symbol: json.dumps(tick, default=str) for symbol, tick in changed.values()}
+                        pipe.hset(hash_key, mapping=mapping)
                     pipe.expire(hash_key, 24 * 60 * 60)
-                    pipe.expire(list_key, 24 * 60 * 60)
+                    for queue_key in queue_keys:
+                        pipe.expire(queue_key, 24 * 60 * 60)
                     pipe.execute()
+                for _, recv_ts in batches:
+                    self.latency.record_since("receive_to_publish", recv_ts)
             except redis.RedisError as e:
                 logger.error(f"Redis pipeline error: {e}")
+                self.coalescer.requeue(changed)
+            self.flush_sizer.record(len(batches), started)
+
+    def stats(self):
+        return {
+            "queue": self.tick_dq.stats(),
+            "flush": self.flush_sizer.stats(),
+            "coalescer": self.coalescer.stats(),
+            "snapshot": self.ticks.stats(),
+            "shards": self.kws.stats(),
+            "tick_modes": self.tick_modes.stats(),
+            "latency": self.latency.snapshot()["latency"],
+            "leader": self.lease.stats() if self.lease else None,
+        }
+
+    def publish_stats(self, interval=5):
+        """queue depth / flush latency / drops on telemetry_channel, sized for expiry-day planning"""
+        while True:
+            time.sleep(interval)
+            if not self.is_running:
+                continue
+            try:
+                self.redis.publish("telemetry_channel", json.dumps({"source": module_name, **self.stats()}))
+                self.latency.snapshot(reset=True)  # next publish covers the next interval
+            except redis.RedisError as e:
+                logger.error(f"Redis telemetry error: {e}")
 
     def monitor(self):
 
@@ -160,6 +260,7 @@ class KiteSocket(BaseService):
             if not self.trading_hour.is_open():
                 seconds_until_open = self.trading_hour.time_until_next_open().total_seconds()
                 next_open_time = datetime.datetime.now() + datetime.timedelta(seconds=seconds_until_open)
+                logger.info(f"tick stats: {self.stats()}")
                 self.stop()
                 logger.info(
                     f'suspending ticker till {next_open_time:%d-%b-%Y %H:%M} | {seconds_until_open:.0f} seconds')
@@ -173,18 +274,39 @@ class KiteSocket(BaseService):
                     self.start_kiteticker(access_token)
                     self.is_running = True
                     self.date_str = datetime.datetime.now().strftime('%Y%m%d')
+                    self.coalescer.reset()
+                    self.ticks.reset()
+                    self.tick_modes.reset_stats()
 
         def heartbeat_check():
-            if self.is_running and time.time() - self.last_tick_time > 10:
-                logger.warning("No ticks for 10s — assuming dead WebSocket.")
-                self.stop()
+            if self.is_running and self.trading_hour.is_open():
+                for shard in self.kws.reconnect_stale(stale_sec=10):
+                    threading.Thread(target=self.backfill, args=(list(shard.tokens),), daemon=True).start()
 
         while True:
             suspend_ticker()
             start_ticker()
-            # heartbeat_check()
+            heartbeat_check()
             time.sleep(1)
 
+    def backfill(self, tokens, chunk=500):
+        """
+        Latest REST quote for tokens, fed through on_ticks as ticks, so the candles of a reconnect gap still get
+        the current price / volume / oi (kite quote takes up to 500 instruments per call).
+        """
+        symbols = [self.inst_symbol_dict[t] for t in tokens if self.inst_symbol_dict and t in self.inst_symbol_dict]
+        filled = 0
+        for ix in range(0, len(symbols), chunk):
+            try:
+                quotes = self.kite.quote(symbols[ix:ix + chunk])
+            except Exception as e:
+                logger.error(f"quote backfill failed: {e}")
+                return
+            ticks = [quote_to_tick(q) for q in quotes.values()]
+            self.kws.feed(ticks)
+            filled += len(ticks)
+        logger.info(f"backfilled {filled} instruments from REST quotes")
+
     @staticmethod
     def restart_program():
         """Restart the current process"""
@@ -194,39 +316,35 @@ class KiteSocket(BaseService):
         # os.kill(os.getppid(), signal.SIGHUP)  # if running in gunicorn.
 
     def stop(self):
-        if self.kws:
+        if self.lease:
+            self.lease.release()
+        try:
+            self.kws.save_rates(self.redis)  # before the daily restart drops the counts
+        except redis.RedisError as e:
+            logger.error(f"Tick rates not saved: {e}")
+        if self.kws.shards:
             self.kws.close()
             self.kws_closed_event.wait(timeout=10)
         self.is_running = False
         self.inst_symbol_dict = None
         self.eq_symbol_set = set()
-        self.kws = None
+        self.kws.shards = []
 
     def get_inst(self):
         return self.get_inst_derivative() | self.get_inst_eq()
 
     def get_inst_derivative(self):
         try:
-            df_raw = pd.DataFrame(self.kite.instruments())
-            logger.info(f"Downloaded {len(df_raw)} kite instruments")
+            # cached per trading day, so a reconnect does not download the instrument dump again
+            master = InstrumentMaster.get(kite=self.kite)
         except Exception as e:
             logger.info(f"Error fetching instruments: {e }")
             return {}
         else:
             idx_symbol = ["NIFTY 50", "SENSEX", "NIFTY BANK", "INDIA VIX"]
-            df_idx = df_raw[df_raw.segment.isin(["INDICES"]) & df_raw.tradingsymbol.isin(idx_symbol)]
-
             name_list = ['NIFTY', 'SENSEX', "BANKNIFTY"]
             exchange_list = ['NFO', 'BFO']
-
-            df_derivative = df_raw[df_raw['name'].isin(name_list) & df_raw['exchange'].isin(exchange_list)]
-            min_dates = df_derivative.groupby('name')['expiry'].min()
-            df_derivative = df_derivative[df_derivative['expiry'].isin(sorted(set(min_dates))[:2])]
-            df_concat = pd.concat([df_idx, df_derivative], ignore_index=True)
-            df_concat['symbol'] = df_concat['exchange'] + ":" + df_concat['tradingsymbol']
-
-            df_dict = df_concat.set_index('instrument_token')['symbol'].to_dict()
-            return df_dict
+            return master.indices(idx_symbol) | master.derivatives(name_list, exchange_list, n_expiries=2)
 
     def get_inst_eq(self):
         data = self.redis_1.hgetall("scrips_nifty750")
@@ -1,4 +1,4 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Query
 from contextlib import asynccontextmanager
 from ticks import KiteSocket
 from fastapi.middleware.cors import CORSMiddleware
@@ -27,11 +27,54 @@ app.add_middleware(
 
 
 @app.get("/")
-async def get_latest_prices():
+async def get_latest_prices(since: int | None = None):
+    """
+    {"seq", "full", "ticks"}; pass the returned seq back as ?since= to get only the symbols that ticked after it.
+    full is true when the whole table is returned (no / stale cursor), the client should then replace its copy.
+    """
     if not socket_instance:
         return {"error": "Socket not initialized"}
 
-    return socket_instance.ticks
+    return socket_instance.ticks.since(since)
+
+
+@app.get("/batch")
+async def get_symbols(symbols: str = Query(..., description="comma separated, e.g. NSE:INFY,NSE:TCS")):
+    """latest tick for several symbols in one call; symbols without a tick yet are omitted"""
+    if not socket_instance:
+        return {"error": "Socket not initialized"}
+
+    return socket_instance.ticks.get_many(s.strip() for s in symbols.split(",") if s.strip())
+
+
+@app.get("/stats")
+async def get_stats():
+    """tick queue depth / drops, flush latency and coalescer counters"""
+    if not socket_instance:
+        return {"error": "Socket not initialized"}
+
+    return socket_instance.stats()
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """exchange -> receive -> redis publish latency (p50 / p99 / max) for the current telemetry window"""
+    if not socket_instance:
+        return {"error": "Socket not initialized"}
+
+    return socket_instance.latency.snapshot()
+
+
+@app.get("/leader")
+async def get_leader():
+    """hot-standby lease: this instance's role, current holder and recent failovers with their duration"""
+    if not socket_instance:
+        return {"error": "Socket not initialized"}
+    if not socket_instance.lease:
+        return {"role": "leader", "lease": None}
+
+    lease = socket_instance.lease
+    return {**lease.stats(), "lease": lease.current(), "failovers": lease.failovers()}
 
 
 @app.get("/{symbol}")